@@ -0,0 +1,86 @@
+"""Measure the cost of loading the plugin with `python -X importtime`.
+
+Every CKAN process (web worker, `ckan` CLI, background job) imports the
+plugin, so it must not pull the validation stack. The script reports the
+slowest modules imported by the plugin and fails when any of the heavy
+dependencies is imported eagerly.
+
+    python benchmarks/import_time.py --top 15
+"""
+
+from __future__ import annotations
+
+import argparse
+import subprocess
+import sys
+
+# modules that must be imported only when ISO document is built or validated
+HEAVY = (
+    "xmlschema",
+    "lxml.isoschematron",
+    "faker",
+    "exrex",
+    "pycountry",
+    "pyproj",
+    "ckanext.iso19115.utils",
+    "ckanext.iso19115.builder",
+    "ckanext.iso19115.types",
+)
+
+# CKAN itself is not a subject of the measurement
+BASELINE = "import ckan.plugins, ckan.plugins.toolkit, ckan.lib.helpers, ckan.model"
+TARGET = "ckanext.iso19115.plugin"
+
+
+def importtime(statement: str) -> list[tuple[int, int, str]]:
+    """Return (self, cumulative, module) timings in microseconds."""
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+
+    result = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:") :].split("|")
+        result.append((int(own), int(cumulative), name.strip()))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    before = {name for _, _, name in importtime(BASELINE)}
+    timings = [
+        item
+        for item in importtime(f"{BASELINE}; import {TARGET}")
+        if item[2] not in before
+    ]
+
+    total = sum(own for own, _, _ in timings) / 1000
+    print(f"{TARGET}: {total:.1f}ms on top of CKAN, {len(timings)} module(s)")
+    for own, cumulative, name in sorted(timings, reverse=True)[: args.top]:
+        print(f"  {own / 1000:8.1f}ms {cumulative / 1000:8.1f}ms  {name}")
+
+    eager = sorted(
+        {
+            name
+            for _, _, name in timings
+            for heavy in HEAVY
+            if name == heavy or name.startswith(heavy + ".")
+        }
+    )
+    if eager:
+        print("Heavy modules imported together with the plugin:")
+        for name in eager:
+            print(f"  {name}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
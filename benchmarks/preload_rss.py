@@ -0,0 +1,102 @@
+"""Compare memory usage of forked workers with and without preload.
+
+Master process forks workers, each of them validates an example document and
+reports its memory from /proc/self/smaps_rollup (Linux only). RSS counts
+shared pages in every worker, PSS splits them between processes that share
+them, and Private_Dirty is the memory that belongs to the worker alone.
+
+    python benchmarks/preload_rss.py --workers 4 --cache-dir /tmp/iso19115
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import warnings
+from pathlib import Path
+
+import ckan.plugins.toolkit as tk
+
+from ckanext.iso19115 import config, utils, validation
+
+EXAMPLE = Path(__file__).parents[1] / "ckanext/iso19115/tests/examples/v3.2/complex.xml"
+FIELDS = ("Rss", "Pss", "Private_Dirty")
+
+
+def memory() -> dict[str, int]:
+    result = {}
+    with open("/proc/self/smaps_rollup") as src:
+        for line in src:
+            key, _sep, value = line.partition(":")
+            if key in FIELDS:
+                result[key] = int(value.split()[0])
+    return result
+
+
+def worker(content: bytes, pipe: int):
+    validation.ValidationPipeline(content).validate()
+    os.write(pipe, json.dumps(memory()).encode() + b"\n")
+
+
+def master(preload: bool, workers: int) -> list[dict[str, int]]:
+    content = EXAMPLE.read_bytes()
+    if preload:
+        utils.preload()
+
+    read, write = os.pipe()
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if not pid:
+            os.close(read)
+            try:
+                worker(content, write)
+            finally:
+                os._exit(0)
+        children.append(pid)
+
+    os.close(write)
+    for pid in children:
+        os.waitpid(pid, 0)
+
+    with os.fdopen(read) as src:
+        return [json.loads(line) for line in src]
+
+
+def report(mode: str, stats: list[dict[str, int]]):
+    print(f"{mode}:")
+    for idx, item in enumerate(stats):
+        values = ", ".join(f"{f}={item[f] / 1024:.1f}MiB" for f in FIELDS)
+        print(f"  worker #{idx}: {values}")
+    total = sum(item["Pss"] for item in stats) / 1024
+    print(f"  total PSS: {total:.1f}MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--cache-dir", required=True)
+    parser.add_argument("--mode", choices=["preload", "lazy"])
+    args = parser.parse_args()
+
+    warnings.simplefilter("ignore")
+    tk.config[config.CONFIG_CACHE_DIR] = args.cache_dir
+
+    if args.mode:
+        json.dump(master(args.mode == "preload", args.workers), sys.stdout)
+        return
+
+    # build cache artifacts, so that neither mode pays for compilation
+    utils.warm_cache()
+
+    for mode in ["lazy", "preload"]:
+        # every mode starts in a clean interpreter
+        output = subprocess.check_output([sys.executable, *sys.argv, "--mode", mode])
+        report(mode, json.loads(output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Compare peak memory of tree and stream validation of huge records.
+
+Synthetic records of every requested size are produced from the example
+document. `sections` shape repeats the identification section, which is the
+best case for stream mode: every top-level section is small. `keywords` shape
+repeats keywords inside the single identification section, which is the
+worst case: stream mode keeps the whole section in memory. Every mode
+validates XSD and codelists of the record in a clean interpreter and reports
+the growth of peak RSS caused by validation (Linux only). Peak is reset after
+loading the compiled schema, so that the memory it occupies is not counted.
+Compare sizes to see how memory grows with the document.
+
+    python benchmarks/stream_memory.py --cache-dir /tmp/iso19115
+    python benchmarks/stream_memory.py --size 5 50 --shape keywords \\
+        --cache-dir /tmp/iso19115
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from pathlib import Path
+
+import ckan.plugins.toolkit as tk
+
+from ckanext.iso19115 import config, utils, validation
+
+EXAMPLE = Path(__file__).parents[1] / "ckanext/iso19115/tests/examples/v3.2/complex.xml"
+SECTION = (b"<mdb:identificationInfo>", b"</mdb:identificationInfo>")
+ABSTRACT_END = b"</mri:abstract>"
+KEYWORDS = b"""
+         <mri:descriptiveKeywords>
+            <mri:MD_Keywords>
+               <mri:keyword>
+                  <gco:CharacterString>Keyword</gco:CharacterString>
+               </mri:keyword>
+            </mri:MD_Keywords>
+         </mri:descriptiveKeywords>"""
+
+
+def generate(path: Path, size: int, shape: str):
+    """Write a record of approximately `size` bytes without keeping it in memory."""
+    content = EXAMPLE.read_bytes()
+    if shape == "sections":
+        start = content.index(SECTION[0])
+        end = content.index(SECTION[1]) + len(SECTION[1])
+        head, unit, tail = content[:start], content[start:end], content[end:]
+    else:
+        # keywords follow the abstract of the only identification section
+        start = content.index(ABSTRACT_END) + len(ABSTRACT_END)
+        head, unit, tail = content[:start], KEYWORDS, content[start:]
+
+    with path.open("wb") as dest:
+        dest.write(head)
+        for _ in range(max(1, (size - len(head) - len(tail)) // len(unit))):
+            dest.write(unit)
+        dest.write(tail)
+
+
+def status(field: str) -> int:
+    """Memory counter of the current process from /proc/self/status in KiB."""
+    with open("/proc/self/status") as src:
+        for line in src:
+            if line.startswith(f"{field}:"):
+                return int(line.split()[1])
+    raise RuntimeError(f"{field} is not available")
+
+
+def measure(path: Path, stream: bool) -> dict[str, float]:
+    utils.warm_cache()
+    base = status("VmRSS")
+    # reset peak RSS to the current value
+    with open("/proc/self/clear_refs", "w") as dest:
+        dest.write("5")
+    start = time.perf_counter()
+    with path.open("rb") as source:
+        validation.ValidationPipeline(source).validate(schematron=False, stream=stream)
+
+    return {"time": time.perf_counter() - start, "memory": status("VmHWM") - base}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--size",
+        type=int,
+        nargs="+",
+        default=[5, 20, 50],
+        help="Sizes of records, MB",
+    )
+    parser.add_argument(
+        "--shape",
+        choices=["sections", "keywords"],
+        default="sections",
+        help="Repeat top-level sections or keywords inside one section",
+    )
+    parser.add_argument("--cache-dir", required=True)
+    parser.add_argument("--record", type=Path)
+    parser.add_argument("--mode", choices=["tree", "stream"])
+    args = parser.parse_args()
+
+    warnings.simplefilter("ignore")
+    tk.config[config.CONFIG_CACHE_DIR] = args.cache_dir
+    tk.config[config.CONFIG_RESULT_CACHE_SIZE] = 0
+
+    if args.mode:
+        json.dump(measure(args.record, args.mode == "stream"), sys.stdout)
+        return
+
+    # build cache artifacts, so that neither mode pays for compilation
+    utils.warm_cache()
+
+    for size in args.size:
+        with tempfile.TemporaryDirectory() as tmp:
+            record = Path(tmp) / "record.xml"
+            generate(record, size * 1024 * 1024, args.shape)
+            mib = record.stat().st_size / 1024 / 1024
+            print(f"record: {mib:.1f}MiB, {args.shape}")
+
+            for mode in ["stream", "tree"]:
+                # every mode starts in a clean interpreter
+                command = [sys.executable, *sys.argv, "--record", str(record)]
+                output = subprocess.check_output([*command, "--mode", mode])
+                stats = json.loads(output)
+                print(
+                    f"{mode}: peak memory +{stats['memory'] / 1024:.1f}MiB,"
+                    f" {stats['time']:.1f}s"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -3,14 +3,13 @@ from __future__ import annotations
 import contextlib
 import contextvars
 import enum
+import functools
 import json
 import logging
 import re
 from typing import Any, Iterable, Optional
 
-import exrex
 import xmlschema
-from faker import Faker
 from typing_extensions import TypeAlias
 from xmlschema.validators import (
     XsdAnyElement,
@@ -42,12 +41,22 @@ recursive = contextvars.ContextVar("recursive", default=False)
 depth = contextvars.ContextVar("depth", default=0)
 inside_union = contextvars.ContextVar("inside_union", default=False)
 
-faker = Faker()
-
 skip_optional = contextvars.ContextVar("skip_optional", default=False)
 max_depth = contextvars.ContextVar("max_depth", default=0)
 
 
+@functools.lru_cache(1)
+def get_faker():
+    """Shared generator of fake values for examples.
+
+    Faker loads all its providers on initialization, so it's created only when
+    the first example is requested.
+    """
+    from faker import Faker
+
+    return Faker()
+
+
 def check_bounds(node):
     if isinstance(node, SkipNode):
         return node
@@ -84,11 +93,16 @@ class Builder:
         self.root = el
 
     def build(self, data):
+        # data belongs to the caller, so namespaces are added to the copy of
+        # the top-level node instead of the original attributes
         ns = {f"xmlns:{k}": v for k, v in utils.ns.items()}
-        if len(data) < 2 or not isinstance(data[1], dict):
-            data[1:1] = [{}]
-        data[1].update(ns)
-        el = self.root.encode(data, converter=xmlschema.JsonMLConverter)
+        tag, *children = data
+        attrs = {}
+        if children and isinstance(children[0], dict):
+            attrs = children.pop(0)
+
+        node = [tag, {**attrs, **ns}, *children]
+        el = self.root.encode(node, converter=xmlschema.JsonMLConverter)
         return el
 
     def example(
@@ -98,8 +112,10 @@ class Builder:
         skip_optional: bool = True,
         max_depth: int = 0,
     ):
+        from faker import Faker
+
         if not seed:
-            seed = Faker().pystr()
+            seed = get_faker().pystr()
         log.info("Using seed: %s", seed)
         Faker.seed(seed)
 
@@ -319,7 +335,7 @@ class BaseNode:
 
                 if not options:
                     return NotImplementedNode(root.node)
-                root = faker.random_element(options)._unwrap()
+                root = get_faker().random_element(options)._unwrap()
 
         return root
 
@@ -393,7 +409,7 @@ class ChoiceNode(BaseNode):
     def example(self, format):
         with self.visit() as options:
             children = self._unwrap_children(options)
-            choice = faker.random_element(children)
+            choice = get_faker().random_element(children)
             value = choice.value(format)
             if format == "bf":
                 return value if choice.is_composed() else {"$": value}
@@ -492,6 +508,7 @@ class RecursionNode(BaseNode):
 
 class AtomicNode(BaseNode):
     def example(self, format):
+        faker = get_faker()
         validators = self.node.validators
         for validator in validators:
             if isinstance(validator, XsdEnumerationFacets):
@@ -518,6 +535,8 @@ class AtomicNode(BaseNode):
 
         if node.local_name == "string":
             if self.node.patterns:
+                import exrex
+
                 pat = self.node.patterns.regexps[0]
                 try:
                     return exrex.getone(pat)
@@ -599,7 +618,7 @@ class ElementNode(BaseNode):
         local_name = root.node.local_name
         if local_name in utils.codelist_names():
             options = utils.codelist_options(local_name)
-            valid_code = faker.random_element(options)
+            valid_code = get_faker().random_element(options)
             attrs["codeListValue"] = valid_code.name
             # XXX: debug
             if local_name == "CI_DateTypeCode":
@@ -632,7 +651,7 @@ class UnionNode(BaseNode):
 
     def example(self, cormat):
         with self.visit() as options:
-            choice = faker.random_element(options)
+            choice = get_faker().random_element(options)
             value = choice.example(format)
             if format == "bf":
                 return value if choice.is_composed() else {"$": value}
@@ -651,4 +670,4 @@ class ListNode(BaseNode):
 
     def example(self, format):
         component = AtomicNode(self.node.base_type)
-        return [component.example(format) for _ in range(faker.random_digit())]
+        return [component.example(format) for _ in range(get_faker().random_digit())]
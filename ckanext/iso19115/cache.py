@@ -0,0 +1,340 @@
+"""Files and results shared by processes through the cache directory.
+
+Artifacts(compiled schemas, codelists and schematron validators) are built by
+the first process that needs them and read by the rest. Artifact names include
+the key of their sources, so the directory can be shared between deployments.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import functools
+import json
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import IO, Any, Callable, Iterable, Optional, Tuple, TypeVar
+
+import ckan.plugins.toolkit as tk
+
+from .config import (
+    CONFIG_CACHE_DIR,
+    CONFIG_CACHE_MAX_AGE,
+    CONFIG_RESULT_CACHE_PERSISTENT,
+    CONFIG_RESULT_CACHE_SIZE,
+    DEFAULT_CACHE_MAX_AGE,
+    DEFAULT_RESULT_CACHE_SIZE,
+)
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+# increment when the structure of pickled artifacts changes
+ARTIFACT_VERSION = "2"
+
+T = TypeVar("T")
+
+
+@functools.lru_cache(1)
+def _get_tempdir() -> str:
+    return tempfile.mkdtemp(prefix="iso19115")
+
+
+def get_cache_dir() -> Path:
+    cache_dir = Path(tk.config.get(CONFIG_CACHE_DIR) or _get_tempdir())
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir
+
+
+def _cache_max_age() -> int:
+    days = tk.asint(tk.config.get(CONFIG_CACHE_MAX_AGE, DEFAULT_CACHE_MAX_AGE))
+    return days * 24 * 60 * 60
+
+
+def collect_stale(paths: Iterable[Path], current: tuple[str, ...]):
+    """Remove artifacts that are not current and were not used for a while.
+
+    Deployments that share the cache directory may use different versions of
+    sources, so artifacts with another key are removed only when nobody read
+    them for `cache_max_age` days, see `touch`. Lock files are never removed,
+    because another process may hold them.
+    """
+    max_age = _cache_max_age()
+    if not max_age:
+        return
+
+    deadline = time.time() - max_age
+    for path in paths:
+        if path.name.startswith(current) or path.name.endswith(".lock"):
+            continue
+        try:
+            if path.stat().st_mtime > deadline:
+                continue
+            log.info("Removing stale cache %s", path)
+            if path.is_dir():
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                path.unlink()
+        except FileNotFoundError:
+            # removed by another process
+            continue
+
+
+def touch(path: Path):
+    """Mark the artifact as used, so that it's not collected as stale."""
+    try:
+        os.utime(path)
+    except OSError:
+        # cache may be shared in read-only mode
+        pass
+
+
+@contextlib.contextmanager
+def file_lock(path: Path):
+    """Hold an exclusive inter-process lock associated with the path.
+
+    Lock is advisory and works only on platforms with `fcntl`.
+    """
+    with path.with_name(path.name + ".lock").open("a") as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def write_atomic(path: Path, writer: Callable[[IO[bytes]], Any]):
+    """Write into temporary file and move it to the destination.
+
+    Readers never see partially written file, because rename is atomic.
+    """
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as dest:
+            writer(dest)
+        # mkstemp creates files readable only by owner
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def read_pickle(path: Path) -> Optional[Any]:
+    try:
+        with path.open("rb") as src:
+            return pickle.load(src)
+    except Exception:
+        log.exception("Cannot load the cache from %s", path)
+        return None
+
+
+def cached_artifact(
+    path: Path,
+    build: Callable[[], T],
+    family: str,
+    read: Callable[[Path], Optional[T]] = read_pickle,
+    write: Callable[[T, IO[bytes]], Any] = pickle.dump,
+    rebuild: bool = False,
+    keep: tuple[str, ...] = (),
+) -> T:
+    """Read the artifact from the cache, building it when necessary.
+
+    Only one process builds the artifact, the rest wait for the lock and read
+    the result. When artifact is built, outdated artifacts of the same
+    `family`(glob pattern inside the directory of `path`) are collected,
+    except for the current one and those listed in `keep`.
+    """
+    if not rebuild:
+        artifact = _read_artifact(path, read)
+        if artifact is not None:
+            return artifact
+
+    with file_lock(path):
+        # cache may be ready by the time another process released the lock
+        artifact = None if rebuild else _read_artifact(path, read)
+        if artifact is not None:
+            return artifact
+
+        log.info("Building the cache at %s...", path)
+        artifact = build()
+        write_atomic(path, functools.partial(write, artifact))
+        collect_stale(path.parent.glob(family), (path.name, *keep))
+
+    return artifact
+
+
+def _read_artifact(path: Path, read: Callable[[Path], Optional[T]]) -> Optional[T]:
+    if not path.is_file():
+        return None
+
+    artifact = read(path)
+    if artifact is not None:
+        touch(path)
+    return artifact
+
+
+class ResultCache:
+    """Outcomes of validation, keyed by the digest of the document.
+
+    Recently used outcomes are kept in memory. When the persistent tier is
+    enabled, outcomes are also stored as JSON files inside the cache
+    directory, so they are shared between processes and survive restarts.
+    Outcome is a dictionary of errors, the empty dictionary means that the
+    document is valid.
+
+    Callers own the dictionaries they pass and receive, e.g. CKAN adds
+    `__type` to the error dictionary of ValidationError. Outcomes are stored
+    as immutable tuples and every hit returns a fresh dictionary.
+
+    Persistent tier is best-effort: outcome that cannot be written or read is
+    treated as a miss, so problems with the cache directory never turn into
+    failures of validation.
+    """
+
+    def __init__(self):
+        self._outcomes: OrderedDict[str, _FrozenOutcome] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._outcomes)
+
+    def get(self, key: str) -> Optional[dict[str, list[str]]]:
+        with self._lock:
+            frozen = self._outcomes.get(key)
+            if frozen is not None:
+                self._outcomes.move_to_end(key)
+                self.hits += 1
+                return _thaw_outcome(frozen)
+
+        outcome = None
+        if _result_cache_persistent():
+            outcome = _read_result(_get_result_path(key))
+
+        with self._lock:
+            if outcome is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            frozen = _freeze_outcome(outcome)
+            self._store(key, frozen)
+        return _thaw_outcome(frozen)
+
+    def set(self, key: str, outcome: dict[str, list[str]]):
+        frozen = _freeze_outcome(outcome)
+        self._remember(key, frozen)
+        if not _result_cache_persistent():
+            return
+
+        data = json.dumps(_thaw_outcome(frozen)).encode()
+        path = _get_result_path(key)
+        try:
+            # directory is created once per process, but it may be removed
+            # since then by `cache clear` or by collection of stale results
+            path.parent.mkdir(parents=True, exist_ok=True)
+            write_atomic(path, lambda dest: dest.write(data))
+        except OSError:
+            log.warning("Cannot store the outcome in %s", path, exc_info=True)
+
+    def clear(self):
+        with self._lock:
+            self._outcomes.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {"size": len(self), "hits": self.hits, "misses": self.misses}
+
+    def _remember(self, key: str, outcome: _FrozenOutcome):
+        with self._lock:
+            self._store(key, outcome)
+
+    def _store(self, key: str, outcome: _FrozenOutcome):
+        # must be called under the lock
+        size = result_cache_size()
+        self._outcomes[key] = outcome
+        self._outcomes.move_to_end(key)
+        while len(self._outcomes) > size:
+            self._outcomes.popitem(last=False)
+
+
+_FrozenOutcome = Tuple[Tuple[str, Tuple[str, ...]], ...]
+
+
+def _freeze_outcome(outcome: dict[str, list[str]]) -> _FrozenOutcome:
+    return tuple((field, tuple(messages)) for field, messages in outcome.items())
+
+
+def _thaw_outcome(frozen: _FrozenOutcome) -> dict[str, list[str]]:
+    return {field: list(messages) for field, messages in frozen}
+
+
+def result_cache_size() -> int:
+    return tk.asint(tk.config.get(CONFIG_RESULT_CACHE_SIZE, DEFAULT_RESULT_CACHE_SIZE))
+
+
+def _result_cache_persistent() -> bool:
+    return tk.asbool(tk.config.get(CONFIG_RESULT_CACHE_PERSISTENT))
+
+
+def _get_result_path(key: str) -> Path:
+    stamp, _sep, digest = key.partition("-")
+    return _get_results_dir(get_cache_dir(), stamp) / f"{digest}.json"
+
+
+@functools.lru_cache()
+def _get_results_dir(cache_dir: Path, stamp: str) -> Path:
+    """Directory with results for the current stamp.
+
+    Results produced by outdated rules are removed when the directory is
+    created, unless they are still used by another deployment.
+    """
+    results = cache_dir / "results"
+    collect_stale((p for p in results.glob("*") if p.is_dir()), (stamp,))
+
+    path = results / stamp
+    path.mkdir(parents=True, exist_ok=True)
+    touch(path)
+    return path
+
+
+def _read_result(path: Path) -> Optional[dict[str, list[str]]]:
+    if not path.is_file():
+        return None
+
+    try:
+        return json.loads(path.read_bytes())
+    except FileNotFoundError:
+        # removed by another process
+        return None
+    except (OSError, ValueError):
+        log.exception("Cannot load the cache from %s", path)
+        return None
+
+
+results = ResultCache()
+
+
+def clear_results() -> list[Path]:
+    """Remove stored outcomes and drop those kept in memory."""
+    stored = get_cache_dir() / "results"
+    removed = sorted(stored.glob("*/*.json"))
+    shutil.rmtree(stored, ignore_errors=True)
+    _get_results_dir.cache_clear()
+    results.clear()
+    return removed
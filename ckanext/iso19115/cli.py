@@ -1,13 +1,14 @@
+from __future__ import annotations
+
 import json
 import logging
 import sys
-from typing import Optional
+from typing import Any, Optional
 
 import ckan.plugins.toolkit as tk
 import click
-import xmlschema
 
-from ckanext.iso19115 import utils
+from ckanext.iso19115.config import CONFIG_CACHE_DIR
 
 log = logging.getLogger(__name__)
 
@@ -30,6 +31,13 @@ def build():
 @build.command("xml")
 @click.argument("source", type=click.File("r"), default=sys.stdin)
 def build_xml(source):
+    # xmlschema and ckanext.iso19115.utils (which pulls lxml and compiled
+    # schemas) are imported by commands, so that they do not slow down
+    # unrelated CKAN commands.
+    import xmlschema
+
+    from ckanext.iso19115 import utils
+
     content = bytes(source.read(), "utf8")
     b = utils.get_builder("mdb:MD_Metadata")
     xml = xmlschema.etree_tostring(b.build(json.loads(content)), namespaces=utils.ns)
@@ -57,6 +65,8 @@ def build_describe(
     max_depth: int,
     annotated: bool,
 ):
+    from ckanext.iso19115 import utils
+
     b = utils.get_builder(root)
     b.print_tree(format, skip_optional, qualified, max_depth, annotated)
 
@@ -76,6 +86,8 @@ def build_example(
     skip_optional: bool,
     max_depth: int,
 ):
+    from ckanext.iso19115 import utils
+
     b = utils.get_builder(root)
     example = b.example(format, seed, skip_optional, max_depth)
     click.echo(example)
@@ -88,19 +100,192 @@ def validate():
 
 
 @validate.command("file")
-@click.argument("source", type=click.File("r"), default=sys.stdin)
+@click.argument("source", type=click.File("rb"), default="-")
 @click.option("--codelist", is_flag=True)
 @click.option("--schematron", is_flag=True)
-def validate_file(source, codelist: bool, schematron: bool):
+@click.option(
+    "--all-errors", is_flag=True, help="Report all errors instead of the first one"
+)
+@click.option(
+    "--stream",
+    is_flag=True,
+    help=(
+        "Check XSD and codelists one top-level section at a time. Reduces"
+        " memory, but it still grows with the document"
+    ),
+)
+@click.option("--timings", is_flag=True, help="Show duration of validation phases")
+def validate_file(
+    source,
+    codelist: bool,
+    schematron: bool,
+    all_errors: bool,
+    stream: bool,
+    timings: bool,
+):
     """Validate file/STDIN agains ISO 19115"""
+    from ckanext.iso19115 import validation
 
-    content = bytes(source.read(), "utf8")
+    pipeline = validation.ValidationPipeline(source)
     try:
-        utils.validate_schema(content, validate_codelists=codelist)
-        if schematron:
-            utils.validate_schematron(content)
+        pipeline.validate(codelist, schematron, all_errors, stream)
     except tk.ValidationError as e:
-        for f, error in e.error_summary.items():
-            tk.error_shout(f"{f}: {error}")
+        if all_errors:
+            for f, errors in e.error_dict.items():
+                for error in errors:
+                    tk.error_shout(f"{f}: {error}")
+        else:
+            for f, error in e.error_summary.items():
+                tk.error_shout(f"{f}: {error}")
     else:
         click.secho("Provided document is valid", fg="green")
+    finally:
+        if timings:
+            _echo_profile(pipeline.profile())
+
+
+def _echo_profile(profile: dict[str, Any]):
+    click.echo(f"Size: {profile['size']} bytes")
+    if profile["elements"] is not None:
+        click.echo(f"Elements: {profile['elements']}")
+    if profile["cached"]:
+        click.echo("Outcome is taken from the result cache")
+
+    for phase, duration in profile["timings"].items():
+        click.echo(f"  {phase}: {duration * 1000:.1f}ms")
+
+
+@validate.command("dir")
+@click.argument("sources", nargs=-1, required=True)
+@click.option(
+    "--pattern",
+    default="*.xml",
+    show_default=True,
+    help="Name of files validated inside directories",
+)
+@click.option(
+    "-j",
+    "--workers",
+    type=int,
+    default=0,
+    help="Number of worker processes. Default: one per CPU",
+)
+@click.option("--codelist", is_flag=True)
+@click.option("--schematron", is_flag=True)
+@click.option(
+    "--all-errors", is_flag=True, help="Report all errors instead of the first one"
+)
+@click.option(
+    "--stream",
+    is_flag=True,
+    help=(
+        "Check XSD and codelists one top-level section at a time. Reduces"
+        " memory, but it still grows with the document"
+    ),
+)
+@click.option(
+    "-o",
+    "--output",
+    type=click.File("w"),
+    default="-",
+    help="Destination of JSON-lines report. Default: STDOUT",
+)
+def validate_dir(
+    sources: tuple[str, ...],
+    pattern: str,
+    workers: int,
+    codelist: bool,
+    schematron: bool,
+    all_errors: bool,
+    stream: bool,
+    output,
+):
+    """Validate files from directories or glob patterns agains ISO 19115.
+
+    Every file produces a line of JSON report. Command exits with non-zero
+    code if any file is not valid.
+    """
+    from ckanext.iso19115 import validation
+
+    paths = validation.collect_files(sources, pattern)
+    reports = validation.validate_files(
+        paths, workers, codelist, schematron, all_errors, stream
+    )
+    total = failed = 0
+    for report in reports:
+        total += 1
+        failed += not report["ok"]
+        output.write(json.dumps(report) + "\n")
+        output.flush()
+
+    click.secho(
+        f"Checked {total} file(s): {total - failed} valid, {failed} invalid",
+        fg="red" if failed else "green",
+        err=True,
+    )
+    if failed:
+        raise click.exceptions.Exit(1)
+
+
+@iso19115.group()
+def cache():
+    """Manage pre-compiled schemas, codelists and schematron rules."""
+    pass
+
+
+@cache.command("warm")
+@click.option(
+    "-s",
+    "--schema",
+    "names",
+    multiple=True,
+    help="Name of XSD schema. Default: mdb2",
+)
+def cache_warm(names: tuple[str, ...]):
+    """Build cache artifacts before the first request needs them."""
+    from ckanext.iso19115 import utils
+
+    unknown = set(names) - set(utils.schema_mapping)
+    if unknown:
+        raise click.BadParameter(
+            f"{', '.join(sorted(unknown))}."
+            f" Available: {', '.join(sorted(utils.schema_mapping))}",
+            param_hint="--schema",
+        )
+
+    if not tk.config.get(CONFIG_CACHE_DIR):
+        tk.error_shout(
+            f"{CONFIG_CACHE_DIR} is not set. Cache will be lost"
+            " when the command exits"
+        )
+    utils.warm_cache(names or (utils.DEFAULT_XSD,))
+    click.secho("Cache is ready", fg="green")
+
+
+@cache.command("status")
+def cache_status():
+    """Show the state of cache artifacts."""
+    from ckanext.iso19115 import utils
+
+    status = utils.cache_status()
+    click.echo(f"Directory: {status['cache_dir']}")
+    if not status["persistent"]:
+        click.secho("Directory is temporary and not shared between processes")
+
+    for name, info in status["schemas"].items():
+        state = "built" if info["built"] else "missing"
+        click.echo(f"Schema {name}: {state} ({info['path']})")
+
+    click.echo(f"Validation results in memory: {status['results']['size']}")
+
+    for path in utils.cache_files():
+        click.echo(f"  {path.name}: {path.stat().st_size} bytes")
+
+
+@cache.command("clear")
+def cache_clear():
+    """Remove all cache artifacts."""
+    from ckanext.iso19115 import utils
+
+    removed = utils.clear_cache()
+    click.secho(f"Removed {len(removed)} file(s)", fg="green")
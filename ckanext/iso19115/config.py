@@ -0,0 +1,38 @@
+"""Names of config options.
+
+Kept apart from `utils`, so that the plugin can read its settings without
+importing xmlschema, lxml and the rest of the validation stack.
+"""
+
+CONFIG_CACHE_DIR = "ckanext.iso19115.misc.cache_dir"
+CONFIG_CACHE_MAX_AGE = "ckanext.iso19115.misc.cache_max_age"
+CONFIG_WARM_ON_STARTUP = "ckanext.iso19115.misc.warm_on_startup"
+CONFIG_PRELOAD = "ckanext.iso19115.misc.preload"
+CONFIG_RUNTIME_ROOTS = "ckanext.iso19115.misc.runtime_roots"
+CONFIG_SCHEMATRON_WORKERS = "ckanext.iso19115.misc.schematron_workers"
+CONFIG_SCHEMATRON_FORCE_ALL = "ckanext.iso19115.misc.schematron_force_all"
+CONFIG_MAX_ERRORS = "ckanext.iso19115.misc.max_errors"
+CONFIG_RESULT_CACHE_SIZE = "ckanext.iso19115.misc.result_cache_size"
+CONFIG_RESULT_CACHE_PERSISTENT = "ckanext.iso19115.misc.result_cache_persistent"
+CONFIG_ASYNC_VALIDATION = "ckanext.iso19115.misc.async_validation"
+CONFIG_VALIDATION_BACKEND = "ckanext.iso19115.misc.validation_backend"
+CONFIG_VALIDATION_QUEUE = "ckanext.iso19115.misc.validation_queue"
+CONFIG_VALIDATION_TIMEOUT = "ckanext.iso19115.misc.validation_timeout"
+CONFIG_MAX_UPLOAD_SIZE = "ckanext.iso19115.misc.max_upload_size"
+CONFIG_VALIDATE_DATASETS = "ckanext.iso19115.misc.validate_datasets"
+CONFIG_STORED_ERRORS_MAX = "ckanext.iso19115.misc.stored_errors_max"
+CONFIG_CHECK_WORKERS = "ckanext.iso19115.misc.check_workers"
+CONFIG_CHECK_ROWS_MAX = "ckanext.iso19115.misc.check_rows_max"
+
+DEFAULT_CACHE_MAX_AGE = 30
+DEFAULT_RUNTIME_ROOTS = "mdb:MD_Metadata"
+DEFAULT_SCHEMATRON_WORKERS = 0
+DEFAULT_MAX_ERRORS = 100
+DEFAULT_RESULT_CACHE_SIZE = 1000
+DEFAULT_VALIDATION_BACKEND = "jobs"
+DEFAULT_VALIDATION_QUEUE = "default"
+DEFAULT_VALIDATION_TIMEOUT = 60
+DEFAULT_MAX_UPLOAD_SIZE = 10
+DEFAULT_STORED_ERRORS_MAX = 10
+DEFAULT_CHECK_WORKERS = 4
+DEFAULT_CHECK_ROWS_MAX = 100
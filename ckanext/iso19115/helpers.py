@@ -5,9 +5,7 @@ import re
 import logging
 from typing import Any, Optional, Union
 from typing_extensions import TypedDict
-import pycountry
 import ckan.plugins.toolkit as tk
-from . import utils
 
 _swap_case = re.compile("(?<=[a-z])(?=[A-Z])")
 
@@ -41,6 +39,8 @@ def languages(field: dict[str, Any]):
 
 @functools.lru_cache(1)
 def _get_languages() -> list[AnnotatedOption]:
+    import pycountry
+
     supported = tk.aslist(tk.config.get(CONFIG_LANGUAGES, DEFAULT_LANGUAGES))
     languages = (
         map(pycountry.languages.lookup, supported) if supported else pycountry.languages
@@ -88,6 +88,8 @@ def implementations(field: dict[str, Any]):
 
 @functools.lru_cache()
 def _get_codelist(name: str) -> list[AnnotatedOption]:
+    from ckanext.iso19115 import utils
+
     return [
         AnnotatedOption(
             value=code.name,
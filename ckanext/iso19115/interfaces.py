@@ -2,11 +2,16 @@ from __future__ import annotations
 import logging
 log = logging.getLogger(__name__)
 
+from typing import TYPE_CHECKING
+
 import ckan.plugins as p
 
-import ckanext.iso19115.converter as c
+if TYPE_CHECKING:
+    import ckanext.iso19115.converter as c
 
 
 class IIso19115(p.Interface):
     def iso19115_metadata_converter(self, data_dict) -> c.Converter:
+        import ckanext.iso19115.converter as c
+
         return c.Converter(data_dict)
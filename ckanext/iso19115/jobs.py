@@ -0,0 +1,327 @@
+"""Validation of documents in background jobs.
+
+Web form submits documents into CKAN's job queue and polls the status of the
+job, so that heavy validation runs on dedicated workers instead of web ones.
+Documents are passed to workers as files inside the shared directory, see
+`store_upload`, rather than through the queue itself.
+`LocalJobQueue` runs jobs inside the current process and can replace CKAN's
+queue where Redis and workers are not available, e.g. in tests.
+
+Datasets are validated by the same queue after they are created or updated
+and the outcome is stored by `ckanext.iso19115.model.PackageValidation`.
+"""
+
+from __future__ import annotations
+
+import abc
+import contextlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import IO, Any, Optional
+
+import ckan.plugins.toolkit as tk
+
+from .config import (
+    CONFIG_CACHE_DIR,
+    CONFIG_VALIDATION_BACKEND,
+    CONFIG_VALIDATION_QUEUE,
+    CONFIG_VALIDATION_TIMEOUT,
+    DEFAULT_VALIDATION_BACKEND,
+    DEFAULT_VALIDATION_QUEUE,
+    DEFAULT_VALIDATION_TIMEOUT,
+)
+
+log = logging.getLogger(__name__)
+
+QUEUED = "queued"
+STARTED = "started"
+FINISHED = "finished"
+FAILED = "failed"
+
+# uploads that were not validated within this time are removed
+_UPLOAD_MAX_AGE = 24 * 60 * 60
+
+
+def validate_document(path: str, collect: bool = False) -> dict[str, Any]:
+    """Job that validates the uploaded document, removes it and reports its
+    errors."""
+    from .validation import ValidationPipeline
+
+    try:
+        with open(path, "rb") as source:
+            ValidationPipeline(source).validate(collect=collect)
+    except tk.ValidationError as e:
+        return {"valid": False, "errors": e.error_dict}
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(path)
+
+    return {"valid": True, "errors": {}}
+
+
+def store_upload(source: IO[bytes]) -> str:
+    """Copy the document into a file that is validated by the job.
+
+    Werkzeug spools uploads into unnamed temporary files, which other
+    processes cannot open, so the document is copied once more. Files are
+    stored inside the cache directory, which must be shared by web and job
+    workers. When cache directory is not configured, system's
+    tempdir is used, so that at least processes of the same host can access
+    files. Files that were never validated are removed after a day.
+    """
+    root = Path(tk.config.get(CONFIG_CACHE_DIR) or tempfile.gettempdir())
+    uploads = root / "iso19115-uploads"
+    uploads.mkdir(parents=True, exist_ok=True)
+    _collect_uploads(uploads)
+
+    fd, path = tempfile.mkstemp(dir=uploads, suffix=".xml")
+    try:
+        with os.fdopen(fd, "wb") as dest:
+            shutil.copyfileobj(source, dest)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path
+
+
+def _collect_uploads(uploads: Path):
+    deadline = time.time() - _UPLOAD_MAX_AGE
+    for path in uploads.glob("*.xml"):
+        try:
+            if path.stat().st_mtime < deadline:
+                path.unlink()
+        except FileNotFoundError:
+            # validated in the meantime
+            continue
+
+
+def validate_package(package_id: str) -> Optional[dict[str, Any]]:
+    """Job that validates the dataset and stores the outcome."""
+    from .model import PackageValidation
+    from .validation import ValidationPipeline
+
+    try:
+        content = tk.get_action("iso19115_package_show")(
+            {"ignore_auth": True}, {"id": package_id, "format": "xml"}
+        )
+    except tk.ObjectNotFound:
+        log.warning("Dataset %s does not exist, validation skipped", package_id)
+        return None
+    except tk.ValidationError as e:
+        # dataset cannot be rendered at all
+        return PackageValidation.store(package_id, False, e.error_dict).dictize()
+
+    pipeline = ValidationPipeline(content)
+    valid, errors = True, {}
+    try:
+        pipeline.validate(collect=True)
+    except tk.ValidationError as e:
+        valid, errors = False, e.error_dict
+
+    return PackageValidation.store(package_id, valid, errors, pipeline.digest).dictize()
+
+
+def validate_after_commit(session: Any, package_id: str):
+    """Submit validation of the dataset once the session is committed.
+
+    Dataset is not visible to workers until the transaction that creates or
+    updates it is committed, so jobs are accumulated inside the session and
+    submitted all at once by the next commit.
+    """
+    from sqlalchemy import event
+
+    pending: set[str] = session.info.setdefault("iso19115_validation", set())
+    if not pending:
+        event.listen(session, "after_commit", _submit_pending, once=True)
+    pending.add(package_id)
+
+
+def _submit_pending(session: Any):
+    queue = get_queue()
+    for package_id in session.info.pop("iso19115_validation", ()):
+        queue.submit_package(package_id)
+
+
+def _timeout() -> int:
+    return tk.asint(
+        tk.config.get(CONFIG_VALIDATION_TIMEOUT, DEFAULT_VALIDATION_TIMEOUT)
+    )
+
+
+def _qualified_name(func: Any) -> str:
+    return f"{func.__module__}.{func.__qualname__}"
+
+
+def _failure(reason: str) -> dict[str, Any]:
+    return {"valid": False, "errors": {"job": [reason]}}
+
+
+class JobQueue(abc.ABC):
+    """Storage of validation jobs.
+
+    `status` returns a dictionary with `id` and `status` (one of queued,
+    started, finished, failed) of the job. Finished and failed jobs also have
+    `valid` flag and `errors`. None is returned when job does not exist or
+    it's not a validation job.
+    """
+
+    def submit(self, source: IO[bytes], collect: bool = False) -> str:
+        """Validate the document, returning ID of the job.
+
+        Document is copied into the file, so that neither the web worker nor
+        the queue keeps it in memory until the job is started.
+        """
+        path = store_upload(source)
+        try:
+            return self._submit(path, collect)
+        except BaseException:
+            os.unlink(path)
+            raise
+
+    @abc.abstractmethod
+    def _submit(self, path: str, collect: bool) -> str: ...
+
+    @abc.abstractmethod
+    def submit_package(self, package_id: str) -> Optional[str]:
+        """Validate the dataset. Outcome is stored instead of being reported
+        by `status`, so ID of the job is returned only when the backend can
+        track it."""
+        ...
+
+    @abc.abstractmethod
+    def status(self, job_id: str) -> Optional[dict[str, Any]]: ...
+
+
+class CkanJobQueue(JobQueue):
+    """Jobs executed by `ckan jobs worker`."""
+
+    def _submit(self, path: str, collect: bool) -> str:
+        job = tk.enqueue_job(
+            validate_document,
+            [path, collect],
+            title="ISO 19115 validation",
+            queue=tk.config.get(CONFIG_VALIDATION_QUEUE, DEFAULT_VALIDATION_QUEUE),
+            rq_kwargs={"timeout": _timeout()},
+        )
+        return job.id
+
+    def submit_package(self, package_id: str) -> Optional[str]:
+        job = tk.enqueue_job(
+            validate_package,
+            [package_id],
+            title=f"ISO 19115 validation of {package_id}",
+            queue=tk.config.get(CONFIG_VALIDATION_QUEUE, DEFAULT_VALIDATION_QUEUE),
+            rq_kwargs={"timeout": _timeout()},
+        )
+        return job.id
+
+    def status(self, job_id: str) -> Optional[dict[str, Any]]:
+        from ckan.lib import jobs
+
+        try:
+            job = jobs.job_from_id(job_id)
+        except KeyError:
+            return None
+
+        # the queue is shared with other jobs, which must not be exposed
+        if job.func_name != _qualified_name(validate_document):
+            return None
+
+        status = job.get_status()
+        status = getattr(status, "value", status)
+        report = {"id": job_id, "status": status}
+
+        if status == FINISHED:
+            result = job.return_value() if hasattr(job, "return_value") else job.result
+            report.update(result)
+        elif status in (FAILED, "stopped", "canceled"):
+            report.update(_failure("Validation failed or exceeded the time limit"))
+            report["status"] = FAILED
+        elif status != STARTED:
+            report["status"] = QUEUED
+
+        return report
+
+
+class LocalJobQueue(JobQueue):
+    """Jobs executed by a thread pool of the current process.
+
+    Thread cannot be interrupted, so the job that exceeds the time limit is
+    reported as failed, but keeps running until validation is over.
+    """
+
+    # finished jobs are forgotten when there are too many of them
+    max_jobs = 1000
+
+    def __init__(self, workers: int = 1):
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="iso19115")
+        self._jobs: OrderedDict[str, tuple[Future[Any], float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _submit(self, path: str, collect: bool) -> str:
+        job_id = str(uuid.uuid4())
+        future = self._executor.submit(validate_document, path, collect)
+        with self._lock:
+            self._jobs[job_id] = (future, time.monotonic())
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+        return job_id
+
+    def submit_package(self, package_id: str) -> Optional[str]:
+        # outcome is stored by the job, the future is not tracked
+        self._executor.submit(_validate_package_locally, package_id)
+        return None
+
+    def status(self, job_id: str) -> Optional[dict[str, Any]]:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+
+        future, submitted = job
+        report: dict[str, Any] = {"id": job_id}
+        if future.done():
+            error = future.exception()
+            if error:
+                log.error("Validation job %s failed: %s", job_id, error)
+                report.update(_failure("Validation failed"), status=FAILED)
+            else:
+                report.update(future.result(), status=FINISHED)
+        elif time.monotonic() - submitted > _timeout():
+            report.update(_failure("Validation exceeded the time limit"))
+            report["status"] = FAILED
+        else:
+            report["status"] = STARTED if future.running() else QUEUED
+
+        return report
+
+
+def _validate_package_locally(package_id: str):
+    from ckan import model
+
+    try:
+        validate_package(package_id)
+    except Exception:
+        log.exception("Validation of dataset %s failed", package_id)
+    finally:
+        # thread-local session is not reused by anything else
+        model.Session.remove()
+
+
+_backends = {"jobs": CkanJobQueue, "local": LocalJobQueue}
+_queues: dict[str, JobQueue] = {}
+
+
+def get_queue() -> JobQueue:
+    """Queue selected by the config option."""
+    backend = tk.config.get(CONFIG_VALIDATION_BACKEND, DEFAULT_VALIDATION_BACKEND)
+    if backend not in _queues:
+        _queues[backend] = _backends[backend]()
+    return _queues[backend]
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import io
+import logging
+import os
+import threading
+import weakref
+import zipfile
+from email.message import Message
+from pathlib import Path, PurePath
+from typing import IO, Any, Optional, Union
+from urllib.request import BaseHandler, OpenerDirector, Request, build_opener
+from urllib.request import url2pathname
+from urllib.response import addinfourl
+
+from lxml import etree as ltree
+
+log = logging.getLogger(__name__)
+
+StrPath = Union[str, "os.PathLike[str]"]
+
+# loaders that must reopen the archive in forked processes
+_loaders: weakref.WeakSet[ResourceLoader] = weakref.WeakSet()
+
+
+class ResourceLoader:
+    """Access to XML files shipped with the extension.
+
+    Files are addressed by the paths they have after extraction of the
+    archive into the `root` directory. When archive exists, files are read
+    directly from it, using an index of archive members built on the first
+    access. Paths that are not inside the archive are read from filesystem.
+
+    Forked processes inherit the descriptor of the archive together with its
+    file offset, so concurrent reads of parent and children would corrupt
+    each other. Every process reads the archive through its own handle,
+    which is reopened after fork.
+    """
+
+    def __init__(self, root: Path, archive: Path):
+        self.root = Path(os.path.abspath(root))
+        self.archive = archive
+        self._index: Optional[dict[str, zipfile.ZipInfo]] = None
+        self._zip: Optional[zipfile.ZipFile] = None
+        self._lock = threading.RLock()
+        _loaders.add(self)
+
+    def __getstate__(self) -> dict[str, Any]:
+        return {"root": self.root, "archive": self.archive}
+
+    def __setstate__(self, state: dict[str, Any]):
+        self.__init__(state["root"], state["archive"])
+
+    @property
+    def index(self) -> dict[str, zipfile.ZipInfo]:
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = self._build_index()
+        return self._index
+
+    def _build_index(self) -> dict[str, zipfile.ZipInfo]:
+        try:
+            archive = self._archive()
+        except FileNotFoundError:
+            log.debug("Archive %s does not exist", self.archive)
+            return {}
+
+        return {info.filename: info for info in archive.infolist() if not info.is_dir()}
+
+    def _archive(self) -> zipfile.ZipFile:
+        # must be called under the lock
+        if self._zip is None:
+            self._zip = zipfile.ZipFile(self.archive)
+        return self._zip
+
+    def after_fork(self):
+        # handle and lock of the parent must not be used by the child. Index
+        # remains valid, members are located by their offsets
+        self._lock = threading.RLock()
+        self._zip = None
+
+    def _member(self, path: StrPath) -> Optional[str]:
+        try:
+            relative = PurePath(os.path.abspath(path)).relative_to(self.root)
+        except ValueError:
+            return None
+
+        member = relative.as_posix()
+        return member if member in self.index else None
+
+    def contains(self, path: StrPath) -> bool:
+        """Check if the file is available inside the archive."""
+        return self._member(path) is not None
+
+    def is_file(self, path: StrPath) -> bool:
+        return self.contains(path) or os.path.isfile(path)
+
+    def read_bytes(self, path: StrPath) -> bytes:
+        member = self._member(path)
+        if member is None:
+            return Path(path).read_bytes()
+
+        with self._lock:
+            return self._archive().read(self.index[member])
+
+    def open(self, path: StrPath) -> IO[bytes]:
+        return io.BytesIO(self.read_bytes(path))
+
+    def parse(self, path: StrPath) -> Any:
+        """Parse XML document with lxml, resolving references via loader."""
+        parser = ltree.XMLParser()
+        parser.resolvers.add(_LoaderResolver(self))
+        return ltree.parse(self.open(path), parser, base_url=str(path))
+
+    def opener(self) -> OpenerDirector:
+        """URL opener that reads local files via loader.
+
+        Used by xmlschema when it follows includes and imports of schema.
+        """
+        return build_opener(_LoaderHandler(self))
+
+
+def _reset_after_fork():
+    for loader in list(_loaders):
+        loader.after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class _LoaderHandler(BaseHandler):
+    # must run before the standard FileHandler
+    handler_order = 400
+
+    def __init__(self, loader: ResourceLoader):
+        self.loader = loader
+
+    def file_open(self, req: Request):
+        path = url2pathname(req.selector)
+        if not self.loader.contains(path):
+            return None
+
+        content = self.loader.read_bytes(path)
+        headers = Message()
+        headers["Content-type"] = "application/xml"
+        headers["Content-length"] = str(len(content))
+        return addinfourl(io.BytesIO(content), headers, req.full_url)
+
+
+class _LoaderResolver(ltree.Resolver):
+    def __init__(self, loader: ResourceLoader):
+        super().__init__()
+        self.loader = loader
+
+    def resolve(self, system_url: str, public_id: str, context: Any):
+        path = system_url
+        if path.startswith("file://"):
+            path = url2pathname(path[len("file://") :])
+
+        if not self.loader.contains(path):
+            return None
+        return self.resolve_file(self.loader.open(path), context, base_url=path)
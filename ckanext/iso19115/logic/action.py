@@ -1,20 +1,28 @@
 from __future__ import annotations
 
+import time
+from collections import Counter
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 from typing import TYPE_CHECKING, Any
 
 import ckan.plugins as p
 import ckan.plugins.toolkit as tk
 
-from xmlschema import etree_tostring
-import ckanext.iso19115.utils as u
-import ckanext.iso19115.converter as c
+from ckanext.iso19115.config import (
+    CONFIG_CHECK_ROWS_MAX,
+    CONFIG_CHECK_WORKERS,
+    DEFAULT_CHECK_ROWS_MAX,
+    DEFAULT_CHECK_WORKERS,
+)
 from ckanext.iso19115.interface_ext import Iso19115
 
 import logging
 log = logging.getLogger(__name__)
 
 if TYPE_CHECKING:
+    import ckanext.iso19115.converter as c
     import ckanext.iso19115.types as t
 
 
@@ -22,17 +30,175 @@ def get_actions():
     return {
         "iso19115_package_show": package_show,
         "iso19115_package_check": package_check,
+        "iso19115_package_check_many": package_check_many,
     }
 
 
 @tk.side_effect_free
 def package_check(context, data_dict):
+    """Check if the dataset can be rendered as a valid ISO 19115 document.
+
+    Raises ValidationError when document is not valid. With `timings` flag,
+    returns a dictionary with `valid` flag, `errors`, size of the document,
+    number of elements and duration of rendering and validation phases
+    instead. With `stored` flag, returns the outcome of the last background
+    validation of the dataset without validating it again.
+    """
+    if tk.asbool(data_dict.get("stored")):
+        return _stored_check(context, data_dict)
+
+    import ckanext.iso19115.validation as v
+
+    all_errors = tk.asbool(data_dict.get("all_errors"))
+    timings = tk.asbool(data_dict.get("timings"))
+
+    start = time.perf_counter()
     pkg = tk.get_action("iso19115_package_show")(context, data_dict)
     content = _pkg_into_xml(pkg)
-    u.validate_schema(content, validate_codelists=True)
-    u.validate_schematron(content)
+    render = time.perf_counter() - start
+
+    pipeline = v.ValidationPipeline(content)
+    if not timings:
+        pipeline.validate(collect=all_errors)
+        return True
+
+    result = {"valid": True, "errors": {}}
+    try:
+        pipeline.validate(collect=all_errors)
+    except tk.ValidationError as e:
+        result.update(valid=False, errors=e.error_dict)
+
+    result.update(pipeline.profile())
+    result["timings"] = {"render": render, **result["timings"]}
+    return result
+
+
+def _stored_check(context, data_dict):
+    from ckanext.iso19115.model import PackageValidation
+
+    pkg = context["model"].Package.get(tk.get_or_bust(data_dict, "id"))
+    if not pkg:
+        raise tk.ObjectNotFound("Dataset not found")
+    tk.check_access("package_show", context, {"id": pkg.id})
+
+    record = PackageValidation.get(pkg.id)
+    if not record:
+        raise tk.ObjectNotFound("Dataset was not validated yet")
+    return record.dictize()
+
+
+def package_check_many(context, data_dict):
+    """Check a page of datasets selected by `ids` or by `package_search` query.
+
+    Datasets are rendered by the current process and validated by the
+    long-lived pool of processes, shared by all calls inside the web worker.
+    Returns total `count` of selected datasets, `results` of the page with
+    `id`, `valid` flag and `errors` of every dataset, and `summary` of the
+    page. Dataset that could not be validated, e.g. because its worker was
+    killed, is reported as invalid and the broken pool is replaced by the
+    next call. Action is not available via GET, because it's expensive.
+    """
+    import ckanext.iso19115.validation as v
+
+    tk.check_access("iso19115_package_check_many", context, data_dict)
+
+    rows_max = tk.asint(tk.config.get(CONFIG_CHECK_ROWS_MAX, DEFAULT_CHECK_ROWS_MAX))
+    start = _int_param(data_dict, "start", 0)
+    rows = min(_int_param(data_dict, "rows", rows_max), rows_max)
+    collect = tk.asbool(data_dict.get("all_errors"))
+
+    if "ids" in data_dict:
+        ids = tk.aslist(data_dict["ids"], ",")
+        count = len(ids)
+        ids = ids[start : start + rows]
+    else:
+        search = tk.get_action("package_search")(
+            dict(context),
+            {
+                "q": data_dict.get("q", ""),
+                "fq": data_dict.get("fq", ""),
+                "start": start,
+                "rows": rows,
+                "fl": "id",
+                "include_private": True,
+            },
+        )
+        count = search["count"]
+        ids = [pkg["id"] for pkg in search["results"]]
+
+    workers = tk.asint(tk.config.get(CONFIG_CHECK_WORKERS, DEFAULT_CHECK_WORKERS))
+    pool = v.shared_validation_pool(max(1, workers))
+
+    checks: list[tuple[str, Future[dict[str, Any]]]] = []
+    # documents are validated while the next ones are rendered
+    for id_ in ids:
+        try:
+            content = tk.get_action("iso19115_package_show")(
+                dict(context), {"id": id_, "format": "xml"}
+            )
+        except (tk.ObjectNotFound, tk.NotAuthorized):
+            report = {"ok": False, "errors": {"id": ["Dataset not found"]}}
+            check = _resolved(report)
+        except tk.ValidationError as e:
+            check = _resolved({"ok": False, "errors": e.error_dict})
+        else:
+            if pool:
+                try:
+                    check = pool.submit(v.check_document, content, collect=collect)
+                except BrokenProcessPool as e:
+                    check = _failed(e)
+            else:
+                check = _resolved(v.check_document(content, collect=collect))
+        checks.append((id_, check))
+
+    results = []
+    for id_, check in checks:
+        try:
+            report = check.result()
+        except Exception as e:
+            # failure of a single document must not hide results of the rest
+            log.exception("Validation of dataset %s failed", id_)
+            if pool and isinstance(e, BrokenProcessPool):
+                v.discard_shared_validation_pool(pool)
+            report = {"ok": False, "errors": {"validation": ["Validation failed"]}}
+        results.append({"id": id_, "valid": report["ok"], "errors": report["errors"]})
+
+    errors = Counter(field for r in results for field in r["errors"])
+    valid = sum(1 for r in results if r["valid"])
+    return {
+        "count": count,
+        "start": start,
+        "rows": rows,
+        "results": results,
+        "summary": {
+            "valid": valid,
+            "invalid": len(results) - valid,
+            "errors": dict(errors),
+        },
+    }
+
+
+def _int_param(data_dict: dict[str, Any], name: str, default: int) -> int:
+    try:
+        value = tk.asint(data_dict.get(name, default))
+    except ValueError:
+        value = -1
+
+    if value < 0:
+        raise tk.ValidationError({name: ["Must be a non-negative integer"]})
+    return value
 
-    return True
+
+def _resolved(value: Any) -> Future[Any]:
+    future: Future[Any] = Future()
+    future.set_result(value)
+    return future
+
+
+def _failed(error: BaseException) -> Future[Any]:
+    future: Future[Any] = Future()
+    future.set_exception(error)
+    return future
 
 
 @tk.side_effect_free
@@ -63,7 +229,16 @@ def package_show(context, data_dict):
 
 
 def _pkg_into_xml(pkg: dict[str, Any]):
+    from xmlschema import XMLSchemaValidationError, etree_tostring
+
+    import ckanext.iso19115.utils as u
+    from ckanext.iso19115.validation import SchemaFailure
+
     builder = u.get_builder("mdb:MD_Metadata")
 
-    xml = builder.build(pkg)
+    try:
+        xml = builder.build(pkg)
+    except XMLSchemaValidationError as e:
+        # dataset cannot be encoded, e.g. required element is empty
+        raise tk.ValidationError({"schema": [SchemaFailure.from_error(e).message]})
     return bytes(etree_tostring(xml, namespaces=u.ns), "utf8")
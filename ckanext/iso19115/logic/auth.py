@@ -0,0 +1,19 @@
+from __future__ import annotations
+
+import ckan.plugins.toolkit as tk
+
+
+def get_auth_functions():
+    return {
+        "iso19115_package_check_many": package_check_many,
+    }
+
+
+@tk.auth_disallow_anonymous_access
+def package_check_many(context, data_dict):
+    """Only registered users can validate datasets in bulk.
+
+    Every dataset is still rendered with the permissions of the user, so
+    private datasets of other organizations are reported as missing.
+    """
+    return {"success": True}
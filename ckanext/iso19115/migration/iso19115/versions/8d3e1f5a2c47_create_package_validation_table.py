@@ -0,0 +1,36 @@
+"""Create package validation table
+
+Revision ID: 8d3e1f5a2c47
+Revises:
+Create Date: 2026-10-16 10:12:41.305817
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "8d3e1f5a2c47"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "iso19115_package_validation",
+        sa.Column(
+            "package_id",
+            sa.UnicodeText,
+            sa.ForeignKey("package.id", ondelete="CASCADE"),
+            primary_key=True,
+        ),
+        sa.Column("valid", sa.Boolean, nullable=False),
+        sa.Column("errors", sa.JSON, nullable=False),
+        sa.Column("digest", sa.Unicode(64)),
+        sa.Column("validated_at", sa.DateTime, nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_table("iso19115_package_validation")
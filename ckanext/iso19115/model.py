@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any, Optional
+
+import ckan.plugins.toolkit as tk
+from ckan import model
+from sqlalchemy import Column, ForeignKey, types
+
+from .config import CONFIG_STORED_ERRORS_MAX, DEFAULT_STORED_ERRORS_MAX
+
+
+class PackageValidation(tk.BaseModel):
+    """Outcome of the last validation of the dataset rendered as ISO 19115.
+
+    Table is created by `ckan db upgrade -p iso19115`.
+    """
+
+    __tablename__ = "iso19115_package_validation"
+
+    package_id = Column(
+        types.UnicodeText,
+        ForeignKey("package.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    valid = Column(types.Boolean, nullable=False)
+    errors = Column(types.JSON, nullable=False, default=dict)
+    digest = Column(types.Unicode(64))
+    validated_at = Column(types.DateTime, nullable=False, default=datetime.utcnow)
+
+    @classmethod
+    def get(cls, package_id: str) -> Optional[PackageValidation]:
+        return model.Session.query(cls).get(package_id)
+
+    @classmethod
+    def store(
+        cls,
+        package_id: str,
+        valid: bool,
+        errors: dict[str, list[str]],
+        digest: Optional[str] = None,
+    ) -> PackageValidation:
+        """Replace the outcome of the previous validation.
+
+        Only first messages of every error field are stored, see
+        `ckanext.iso19115.misc.stored_errors_max`.
+        """
+        record = model.Session.merge(
+            cls(
+                package_id=package_id,
+                valid=valid,
+                errors=_cap_errors(errors),
+                digest=digest,
+                validated_at=datetime.utcnow(),
+            )
+        )
+        model.Session.commit()
+        return record
+
+    def dictize(self) -> dict[str, Any]:
+        return {
+            "package_id": self.package_id,
+            "valid": self.valid,
+            "errors": self.errors,
+            "digest": self.digest,
+            "validated_at": self.validated_at.isoformat(),
+        }
+
+
+def _cap_errors(errors: dict[str, Any]) -> dict[str, Any]:
+    limit = tk.asint(tk.config.get(CONFIG_STORED_ERRORS_MAX, DEFAULT_STORED_ERRORS_MAX))
+    capped = {}
+    for field, messages in errors.items():
+        # CKAN adds `__type` and other non-list items to error dictionaries
+        if isinstance(messages, list) and len(messages) > limit:
+            rest = len(messages) - limit
+            messages = messages[:limit] + [f"... and {rest} more errors"]
+        capped[field] = messages
+    return capped
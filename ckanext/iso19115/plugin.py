@@ -6,46 +6,76 @@ try:
 except ImportError:
     IMetaexport = None
 
-from . import cli, interfaces, views, helpers
-from .logic import action
-
 from . import interface_ext
-
-try:
-    config_declarations = tk.blanket.config_declarations
-except AttributeError:
-    config_declarations = lambda cls: cls
+from .config import CONFIG_PRELOAD, CONFIG_VALIDATE_DATASETS, CONFIG_WARM_ON_STARTUP
 
 
-@config_declarations
+@tk.blanket.config_declarations
 class Iso19115Plugin(plugins.SingletonPlugin):
     plugins.implements(plugins.IActions)
+    plugins.implements(plugins.IAuthFunctions)
     plugins.implements(plugins.IClick)
     plugins.implements(plugins.IBlueprint)
+    plugins.implements(plugins.IMiddleware, inherit=True)
     plugins.implements(plugins.IConfigurer)
+    plugins.implements(plugins.IConfigurable)
     plugins.implements(plugins.ITemplateHelpers)
+    plugins.implements(plugins.IPackageController, inherit=True)
     plugins.implements(interface_ext.Iso19115, inherit=True)
 
     if IMetaexport:
         plugins.implements(IMetaexport, inherit=True)
 
+    # submodules are imported by hooks, because every CKAN process loads the
+    # plugin, but only few of them ever build or validate ISO documents.
+
     # IActions
     def get_actions(self):
+        from .logic import action
+
         return action.get_actions()
 
+    # IAuthFunctions
+    def get_auth_functions(self):
+        from .logic import auth
+
+        return auth.get_auth_functions()
+
     # IClick
     def get_commands(self):
+        from . import cli
+
         return cli.get_commands()
 
     # IBlueprint
     def get_blueprint(self):
+        from . import views
+
         return views.get_blueprints()
 
+    # IMiddleware
+    def make_middleware(self, app, config):
+        from . import views
+
+        app.wsgi_app = views.limit_upload_size(app.wsgi_app)
+        return app
+
     # IConfigurer
     def update_config(self, config):
         tk.add_template_directory(config, "templates")
         tk.add_resource("assets", "iso19115")
 
+    # IConfigurable
+    def configure(self, config):
+        if tk.asbool(config.get(CONFIG_PRELOAD)):
+            from . import utils
+
+            utils.preload()
+        elif tk.asbool(config.get(CONFIG_WARM_ON_STARTUP)):
+            from . import utils
+
+            utils.warm_cache()
+
     # IMetaexport
     def register_metaexport_format(self):
         from . import formatter
@@ -61,8 +91,29 @@ class Iso19115Plugin(plugins.SingletonPlugin):
 
     # ITemplateHelpers
     def get_helpers(self):
+        from . import helpers
+
         return helpers.get_helpers()
 
+    # IPackageController
+    def after_dataset_create(self, context, pkg_dict):
+        _validate_dataset(pkg_dict)
+
+    def after_dataset_update(self, context, pkg_dict):
+        _validate_dataset(pkg_dict)
+
+
+def _validate_dataset(pkg_dict):
+    if not tk.asbool(tk.config.get(CONFIG_VALIDATE_DATASETS)):
+        return
+
+    from ckan import model
+
+    from . import jobs
+
+    # listeners are attached to the session of the current thread
+    jobs.validate_after_commit(model.Session(), pkg_dict["id"])
+
 
 def _data_extractor(pkg_id):
     return tk.get_action("iso19115_package_show")({}, {"id": pkg_id})
@@ -3,7 +3,19 @@ from pathlib import Path
 import ckan.plugins.toolkit as tk
 import pytest
 
-from ckanext.iso19115 import utils
+from ckanext.iso19115 import cache, validation
+
+
+@pytest.fixture(autouse=True)
+def clean_results():
+    cache.results.clear()
+
+
+@pytest.fixture
+def clean_db(reset_db, migrate_db_for):
+    """Clean DB with tables of the extension."""
+    reset_db()
+    migrate_db_for("iso19115")
 
 
 @pytest.fixture(scope="session")
@@ -23,7 +35,7 @@ def example(examples, request):
 @pytest.fixture()
 def schema_errors(example):
     try:
-        utils.validate_schema(example, validate_codelists=True)
+        validation.validate_schema(example, validate_codelists=True)
     except tk.ValidationError as e:
         return e.error_dict["schema"]
     return []
@@ -37,7 +49,7 @@ def schematron_errors(example, request):
         if m.name.startswith("schematron_")
     }
     try:
-        utils.validate_schematron(example, schemas)
+        validation.validate_schematron(example, schemas)
     except tk.ValidationError as e:
         return e.error_dict["schematron"]
     return []
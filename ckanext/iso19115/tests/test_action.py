@@ -0,0 +1,157 @@
+import os
+
+import pytest
+
+from ckanext.iso19115 import config, utils, validation
+from ckanext.iso19115.logic import action
+from ckanext.iso19115.model import PackageValidation
+
+
+@pytest.fixture
+def datasets(examples, monkeypatch):
+    """Datasets rendered from examples instead of DB records."""
+    documents = {
+        "valid": (examples / "v3.2/complex.xml").read_bytes(),
+        "no-root": (examples / "v3.2/sch_no_root.xml").read_bytes(),
+        "no-date": (examples / "v3.2/sch_no_creation_date.xml").read_bytes(),
+    }
+
+    def package_show(context, data_dict):
+        if data_dict["id"] not in documents:
+            raise utils.tk.ObjectNotFound()
+        return documents[data_dict["id"]]
+
+    def package_search(context, data_dict):
+        ids = sorted(documents)
+        page = ids[data_dict["start"] : data_dict["start"] + data_dict["rows"]]
+        return {"count": len(ids), "results": [{"id": id_} for id_ in page]}
+
+    actions = {"iso19115_package_show": package_show, "package_search": package_search}
+    monkeypatch.setattr(utils.tk, "get_action", actions.__getitem__)
+    monkeypatch.setattr(utils.tk, "check_access", lambda *args: True)
+    return documents
+
+
+@pytest.fixture(autouse=True)
+def shared_pool():
+    """Shut down the pool created by the test."""
+    yield
+    if validation._shared_pool:
+        validation._shared_pool[1].shutdown()
+        validation._shared_pool = None
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_package_check_many(datasets, workers, monkeypatch):
+    monkeypatch.setitem(utils.tk.config, action.CONFIG_CHECK_WORKERS, workers)
+    result = action.package_check_many({}, {"ids": "valid,missing,no-root"})
+
+    assert result["count"] == 3
+    assert [(r["id"], r["valid"]) for r in result["results"]] == [
+        ("valid", True),
+        ("missing", False),
+        ("no-root", False),
+    ]
+    assert result["summary"] == {
+        "valid": 1,
+        "invalid": 2,
+        "errors": {"id": 1, "schema": 1},
+    }
+
+
+def test_package_check_many_reuses_pool(datasets, monkeypatch):
+    monkeypatch.setitem(utils.tk.config, action.CONFIG_CHECK_WORKERS, 2)
+    action.package_check_many({}, {"ids": "valid"})
+    pool = validation.shared_validation_pool(2)
+
+    action.package_check_many({}, {"ids": "valid,no-root"})
+    assert validation.shared_validation_pool(2) is pool
+
+
+def _crash(content, **options):
+    os._exit(1)
+
+
+def test_package_check_many_broken_pool(datasets, monkeypatch):
+    monkeypatch.setitem(utils.tk.config, action.CONFIG_CHECK_WORKERS, 2)
+    monkeypatch.setattr(validation, "check_document", _crash)
+    result = action.package_check_many({}, {"ids": "valid,missing"})
+
+    assert [(r["id"], r["valid"]) for r in result["results"]] == [
+        ("valid", False),
+        ("missing", False),
+    ]
+    assert result["summary"]["errors"] == {"validation": 1, "id": 1}
+    assert validation._shared_pool is None
+
+
+def test_package_check_many_paging(datasets, monkeypatch):
+    monkeypatch.setitem(utils.tk.config, action.CONFIG_CHECK_ROWS_MAX, 2)
+    result = action.package_check_many({}, {"q": "*:*", "start": 1, "rows": 10})
+
+    assert result["count"] == 3
+    assert result["rows"] == 2
+    assert [r["id"] for r in result["results"]] == ["no-root", "valid"]
+
+    with pytest.raises(utils.tk.ValidationError):
+        action.package_check_many({}, {"ids": [], "start": "-1"})
+
+
+@pytest.mark.usefixtures("with_plugins", "clean_db")
+class TestStoredCheck:
+    def test_private_dataset(self):
+        from ckan.tests import factories, helpers
+
+        user = factories.User()
+        org = factories.Organization(
+            users=[{"name": user["name"], "capacity": "member"}]
+        )
+        dataset = factories.Dataset(owner_org=org["id"], private=True)
+        data_dict = {"id": dataset["name"], "stored": True}
+
+        with pytest.raises(utils.tk.ObjectNotFound):
+            helpers.call_action("iso19115_package_check", **data_dict)
+
+        PackageValidation.store(dataset["id"], False, {"schema": ["Invalid"]}, "x")
+        with pytest.raises(utils.tk.NotAuthorized):
+            helpers.call_action(
+                "iso19115_package_check",
+                {"user": factories.User()["name"], "ignore_auth": False},
+                **data_dict,
+            )
+
+        result = helpers.call_action(
+            "iso19115_package_check",
+            {"user": user["name"], "ignore_auth": False},
+            **data_dict,
+        )
+        assert result["package_id"] == dataset["id"]
+        assert result["errors"] == {"schema": ["Invalid"]}
+
+    def test_errors_capped(self, monkeypatch):
+        from ckan.tests import factories
+
+        monkeypatch.setitem(utils.tk.config, config.CONFIG_STORED_ERRORS_MAX, 2)
+        dataset = factories.Dataset()
+        errors = {"schema": ["a", "b", "c", "d"], "codelist": ["e"]}
+
+        record = PackageValidation.store(dataset["id"], False, errors)
+        assert record.errors == {
+            "schema": ["a", "b", "... and 2 more errors"],
+            "codelist": ["e"],
+        }
+
+
+@pytest.mark.usefixtures("with_plugins", "clean_db")
+def test_package_check_many_auth():
+    from ckan import model
+    from ckan.tests import factories, helpers
+
+    # actions without side_effect_free flag cannot be called via GET
+    assert not getattr(action.package_check_many, "side_effect_free", False)
+    with pytest.raises(utils.tk.NotAuthorized):
+        helpers.call_auth("iso19115_package_check_many", {"user": "", "model": model})
+
+    user = factories.User()
+    context = {"user": user["name"], "model": model}
+    assert helpers.call_auth("iso19115_package_check_many", context)
@@ -0,0 +1,354 @@
+import gc
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from ckanext.iso19115 import cache, config, utils, validation
+
+FULL_XSD = f"{utils.DEFAULT_XSD}:full"
+
+
+class TestSchemaRegistry:
+    def test_schema_loaded_once(self):
+        registry = utils.SchemaRegistry()
+        schema = registry.get(utils.DEFAULT_XSD)
+
+        assert registry.get(utils.DEFAULT_XSD) is schema
+        assert registry.stats() == {
+            "hits": 1,
+            "misses": 1,
+            "loaded": [utils.DEFAULT_XSD],
+            "builders": 0,
+        }
+
+    def test_builder_dropped_with_schema(self):
+        registry = utils.SchemaRegistry()
+        builder = registry.builder("mdb:MD_Metadata", utils.DEFAULT_XSD)
+
+        assert registry.builder("mdb:MD_Metadata", utils.DEFAULT_XSD) is builder
+        registry.invalidate()
+        assert registry.builder("mdb:MD_Metadata", utils.DEFAULT_XSD) is not builder
+
+    def test_invalidate(self):
+        registry = utils.SchemaRegistry()
+        schema = registry.get(utils.DEFAULT_XSD)
+        registry.invalidate(utils.DEFAULT_XSD)
+
+        assert utils.DEFAULT_XSD not in registry
+        assert registry.get(utils.DEFAULT_XSD) is not schema
+        assert registry.misses == 2
+
+    def test_reload(self):
+        registry = utils.SchemaRegistry()
+        schema = registry.get(utils.DEFAULT_XSD)
+        registry.reload()
+
+        assert registry.get(utils.DEFAULT_XSD) is not schema
+        assert registry.stats()["hits"] == 1
+
+    def test_concurrent_counters(self):
+        registry = utils.SchemaRegistry()
+        with ThreadPoolExecutor(8) as pool:
+            list(pool.map(lambda _: registry.get(utils.DEFAULT_XSD), range(400)))
+
+        stats = registry.stats()
+        assert (stats["hits"], stats["misses"]) == (399, 1)
+
+
+class TestCacheKey:
+    def test_key_is_stable(self):
+        key = utils.schema_cache_key(utils.DEFAULT_XSD)
+        utils.schema_cache_key.cache_clear()
+        assert utils.schema_cache_key(utils.DEFAULT_XSD) == key
+
+    def test_key_in_cache_path(self):
+        path = utils._get_cache_path(utils.DEFAULT_XSD)
+        assert utils.schema_cache_key(utils.DEFAULT_XSD) in path.name
+
+    def test_stale_cache_removed(self, tmp_path, monkeypatch):
+        monkeypatch.setitem(utils.tk.config, config.CONFIG_CACHE_DIR, str(tmp_path))
+        monkeypatch.setattr(utils.xmlschema, "XMLSchema", lambda *a, **k: "stub")
+        monkeypatch.setattr(utils, "ComponentIndex", lambda schema: None)
+        runtime = utils._get_cache_path(utils.DEFAULT_XSD, utils._runtime_roots())
+        legacy = tmp_path / f"{utils.DEFAULT_XSD}.pickle"
+        outdated = tmp_path / f"{utils.DEFAULT_XSD}-0000000000000000.pickle"
+        lock = tmp_path / f"{utils.DEFAULT_XSD}-0000000000000000.pickle.lock"
+        used = tmp_path / f"{utils.DEFAULT_XSD}-1111111111111111.pickle"
+        other = tmp_path / "mds2-0000000000000000.pickle"
+        for path in [runtime, legacy, outdated, lock, used, other]:
+            path.touch()
+            if path is not used:
+                os.utime(path, (0, 0))
+
+        utils._load_schema(FULL_XSD)
+
+        assert utils._get_cache_path(utils.DEFAULT_XSD).is_file()
+        assert runtime.is_file()
+        assert other.is_file()
+        assert used.is_file()
+        assert lock.is_file()
+        assert not legacy.exists()
+        assert not outdated.exists()
+
+    def test_stale_cache_kept(self, tmp_path, monkeypatch):
+        monkeypatch.setitem(utils.tk.config, config.CONFIG_CACHE_DIR, str(tmp_path))
+        monkeypatch.setitem(utils.tk.config, config.CONFIG_CACHE_MAX_AGE, 0)
+        outdated = tmp_path / f"{utils.DEFAULT_XSD}-0000000000000000.pickle"
+        outdated.touch()
+        os.utime(outdated, (0, 0))
+
+        cache.collect_stale([outdated], ())
+        assert outdated.is_file()
+
+
+class TestCacheBuild:
+    def test_concurrent_build(self, tmp_path, monkeypatch):
+        monkeypatch.setitem(utils.tk.config, config.CONFIG_CACHE_DIR, str(tmp_path))
+        calls = []
+
+        def build(*args, **kwargs):
+            calls.append(args)
+            time.sleep(0.1)
+            return {"schema": "stub"}
+
+        monkeypatch.setattr(utils.xmlschema, "XMLSchema", build)
+        monkeypatch.setattr(utils, "ComponentIndex", lambda schema: None)
+        with ThreadPoolExecutor(4) as pool:
+            result = list(
+                pool.map(lambda _: utils._load_schema(FULL_XSD).schema, range(4))
+            )
+
+        assert len(calls) == 1
+        assert result == [{"schema": "stub"}] * 4
+        assert not list(tmp_path.glob("*.tmp"))
+
+    def test_broken_cache_rebuilt(self, tmp_path, monkeypatch):
+        monkeypatch.setitem(utils.tk.config, config.CONFIG_CACHE_DIR, str(tmp_path))
+        monkeypatch.setattr(utils.xmlschema, "XMLSchema", lambda *a, **k: "stub")
+        monkeypatch.setattr(utils, "ComponentIndex", lambda schema: None)
+        utils._get_cache_path(utils.DEFAULT_XSD).write_bytes(b"not a pickle")
+
+        assert utils._load_schema(FULL_XSD).schema == "stub"
+
+
+class TestComponentIndex:
+    def test_lookup(self):
+        schema = utils.get_schema(utils.DEFAULT_XSD)
+        index = utils.schemas.index_of(schema)
+        el = schema.maps.elements[utils._qualify("mdb:MD_Metadata")]
+
+        assert index.lookup("mdb:MD_Metadata") is el
+        assert index.lookup(utils._qualify("mdb:MD_Metadata")) is el
+        assert utils.lookup("mdb:MD_Metadata", schema) is el
+        assert utils.lookup("mdb:NotExisting", schema) is None
+
+    def test_persisted_with_schema(self, tmp_path, monkeypatch):
+        monkeypatch.setitem(utils.tk.config, config.CONFIG_CACHE_DIR, str(tmp_path))
+        artifact = utils._load_schema(utils.DEFAULT_XSD)
+
+        assert (
+            artifact.index.lookup("mdb:MD_Metadata")
+            is artifact.schema.maps.elements[utils._qualify("mdb:MD_Metadata")]
+        )
+        assert "MD_TopicCategoryCode" in artifact.index.enumerations
+
+
+class TestSchematronCache:
+    def test_compiled_once(self, tmp_path, monkeypatch):
+        monkeypatch.setitem(utils.tk.config, config.CONFIG_CACHE_DIR, str(tmp_path))
+        utils._get_schematron.cache_clear()
+        utils._get_schematron(("metadata",))
+        assert list(tmp_path.glob("schematron-mdb-*.xsl"))
+
+        def compile(*args, **kwargs):
+            raise AssertionError("Schematron must be loaded from cache")
+
+        utils._get_schematron.cache_clear()
+        monkeypatch.setattr(utils.isoschematron, "Schematron", compile)
+        validator = utils._get_schematron(("metadata",))
+        assert utils._get_schematron(("metadata",)) is validator
+
+    def test_stale_removed(self, tmp_path, monkeypatch):
+        monkeypatch.setitem(utils.tk.config, config.CONFIG_CACHE_DIR, str(tmp_path))
+        stale = tmp_path / "schematron-mdb-0000000000000000.xsl"
+        stale.write_text("<xsl/>")
+        other = tmp_path / "schematron-mdb+mri-0000000000000000.xsl"
+        other.write_text("<xsl/>")
+        for path in [stale, other]:
+            os.utime(path, (0, 0))
+
+        utils._get_schematron.cache_clear()
+        utils._get_schematron(("metadata",))
+
+        assert not stale.exists()
+        assert other.exists()
+
+
+class TestCodelistCatalogue:
+    def test_values(self):
+        catalogue = utils.codelist_catalogue()
+        creation = catalogue["CI_DateTypeCode"]["creation"]
+
+        assert "CI_DateTypeCode" in utils.codelist_names()
+        assert creation.location == f"{utils.CODELIST_LOCATION}#CI_DateTypeCode"
+        assert utils.codelist_options("CI_DateTypeCode") == list(
+            catalogue["CI_DateTypeCode"].values()
+        )
+
+    def test_parsed_once(self, tmp_path, monkeypatch):
+        monkeypatch.setitem(utils.tk.config, config.CONFIG_CACHE_DIR, str(tmp_path))
+        utils.codelist_catalogue.cache_clear()
+        catalogue = utils.codelist_catalogue()
+        assert utils._get_codelist_cache_path().is_file()
+
+        def build():
+            raise AssertionError("Codelists must be loaded from cache")
+
+        utils.codelist_catalogue.cache_clear()
+        monkeypatch.setattr(utils, "_build_codelist_catalogue", build)
+        try:
+            assert utils.codelist_catalogue() == catalogue
+        finally:
+            utils.codelist_catalogue.cache_clear()
+
+
+class TestResultCache:
+    def test_outcome_reused(self, examples, monkeypatch):
+        content = (examples / "v3.2/sch_no_root.xml").read_bytes()
+        with pytest.raises(utils.tk.ValidationError) as first:
+            validation.ValidationPipeline(content).validate()
+
+        monkeypatch.setattr(validation, "get_schema", None)
+        with pytest.raises(utils.tk.ValidationError) as second:
+            validation.ValidationPipeline(content).validate()
+
+        assert second.value.error_dict == first.value.error_dict
+        assert cache.results.stats() == {"size": 1, "hits": 1, "misses": 1}
+
+    @pytest.mark.parametrize("persistent", [False, True])
+    def test_outcome_isolated(self, persistent, tmp_path, monkeypatch):
+        monkeypatch.setitem(utils.tk.config, config.CONFIG_CACHE_DIR, str(tmp_path))
+        monkeypatch.setitem(
+            utils.tk.config, config.CONFIG_RESULT_CACHE_PERSISTENT, persistent
+        )
+        outcome = {"schema": ["error"]}
+        cache.results.set("stamp-key", outcome)
+        outcome["schema"].append("added by caller")
+        outcome["__type"] = "Validation Error"
+
+        hit = cache.results.get("stamp-key")
+        hit["schema"].clear()
+        hit["__type"] = "Validation Error"
+
+        if persistent:
+            cache.results.clear()
+        assert cache.results.get("stamp-key") == {"schema": ["error"]}
+
+    def test_options_in_key(self):
+        pipeline = validation.ValidationPipeline(b"<root/>")
+        assert pipeline.result_key(True, True, False) != pipeline.result_key(
+            True, False, False
+        )
+        assert pipeline.result_key(True, True, False) != validation.ValidationPipeline(
+            b"<root />"
+        ).result_key(True, True, False)
+
+    def test_lru(self, monkeypatch):
+        monkeypatch.setitem(utils.tk.config, config.CONFIG_RESULT_CACHE_SIZE, 2)
+        for key in ["a", "b", "c"]:
+            cache.results.set(key, {})
+        assert cache.results.get("a") is None
+        assert cache.results.get("c") == {}
+
+    def test_persistent(self, tmp_path, monkeypatch):
+        monkeypatch.setitem(utils.tk.config, config.CONFIG_CACHE_DIR, str(tmp_path))
+        monkeypatch.setitem(
+            utils.tk.config, config.CONFIG_RESULT_CACHE_PERSISTENT, True
+        )
+        stale = tmp_path / "results" / "0000000000000000"
+        stale.mkdir(parents=True)
+        os.utime(stale, (0, 0))
+
+        pipeline = validation.ValidationPipeline(b"<root")
+        key = pipeline.result_key(True, True, False)
+        with pytest.raises(utils.tk.ValidationError):
+            pipeline.validate()
+
+        assert cache._get_result_path(key).is_file()
+        assert not stale.exists()
+
+        cache.results.clear()
+        assert "content" in cache.results.get(key)
+
+    def test_results_removed_by_another_process(self, tmp_path, monkeypatch):
+        monkeypatch.setitem(utils.tk.config, config.CONFIG_CACHE_DIR, str(tmp_path))
+        monkeypatch.setitem(
+            utils.tk.config, config.CONFIG_RESULT_CACHE_PERSISTENT, True
+        )
+        cache.results.set("stamp-a", {})
+        shutil.rmtree(tmp_path / "results")
+
+        cache.results.set("stamp-b", {"schema": ["error"]})
+        cache.results.clear()
+        assert cache.results.get("stamp-b") == {"schema": ["error"]}
+
+    def test_failed_write_is_miss(self, tmp_path, monkeypatch):
+        monkeypatch.setitem(utils.tk.config, config.CONFIG_CACHE_DIR, str(tmp_path))
+        monkeypatch.setitem(
+            utils.tk.config, config.CONFIG_RESULT_CACHE_PERSISTENT, True
+        )
+
+        def write_atomic(path, writer):
+            raise PermissionError(path)
+
+        monkeypatch.setattr(cache, "write_atomic", write_atomic)
+        with pytest.raises(utils.tk.ValidationError) as e:
+            validation.ValidationPipeline(b"<root").validate()
+        assert "content" in e.value.error_dict
+
+
+class TestCacheManagement:
+    def test_warm_and_clear(self, tmp_path, monkeypatch):
+        monkeypatch.setitem(utils.tk.config, config.CONFIG_CACHE_DIR, str(tmp_path))
+        monkeypatch.setattr(utils, "schemas", utils.SchemaRegistry())
+        utils._get_schematron.cache_clear()
+        utils.warm_cache()
+
+        status = utils.cache_status()
+        assert status["schemas"][utils.DEFAULT_XSD]["built"]
+        assert status["schemas"][utils.DEFAULT_XSD]["loaded"]
+        assert status["schematron"] == len(
+            utils.schematron_groups(utils.configured_schematron_workers())
+        )
+        assert utils.cache_files()
+
+        assert utils.clear_cache()
+        assert not utils.cache_files()
+        assert utils.cache_status()["schematron"] == 0
+        assert utils.cache_status()["codelists"] == 0
+
+    def test_validation_pool_warms_worker_groups(self, monkeypatch):
+        monkeypatch.setitem(utils.tk.config, config.CONFIG_SCHEMATRON_WORKERS, 12)
+        compiled = []
+        monkeypatch.setattr(utils, "_get_schematron", compiled.append)
+
+        pool = validation.validation_pool(2)
+        if pool is None:
+            pytest.skip("fork is not supported")
+        pool.shutdown()
+
+        assert compiled == utils.schematron_groups(1)
+        assert compiled != utils.schematron_groups(12)
+
+    def test_preload(self, monkeypatch):
+        warmed = []
+        monkeypatch.setattr(utils, "warm_cache", warmed.append)
+        try:
+            utils.preload()
+            assert gc.get_freeze_count()
+        finally:
+            gc.unfreeze()
+        assert warmed == [(utils.DEFAULT_XSD,)]
@@ -1,5 +1,8 @@
 from __future__ import annotations
 
+import copy
+from concurrent.futures import ThreadPoolExecutor
+
 from xmlschema import etree_tostring
 
 import ckanext.iso19115.converter as c
@@ -54,3 +57,22 @@ class TestConverter:
         builder = u.get_builder("mdb:MD_Metadata")
         data = c.jml(el)
         builder.build(data)
+
+    def test_build_keeps_data(self, faker):
+        el: t.mdb.MD_Metadata = h.make("mdb:MD_Metadata")
+        el.add_dateInfo(
+            t.cit.CI_Date(h.date(faker.date_time()), t.cit.CI_DateTypeCode("creation"))
+        )
+        data = c.jml(el)
+        original = copy.deepcopy(data)
+
+        builder = u.get_builder("mdb:MD_Metadata")
+        assert builder is u.get_builder("mdb:MD_Metadata")
+
+        with ThreadPoolExecutor(4) as pool:
+            result = list(
+                pool.map(lambda _: etree_tostring(builder.build(data)), range(8))
+            )
+
+        assert data == original
+        assert len(set(result)) == 1
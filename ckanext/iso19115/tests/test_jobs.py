@@ -0,0 +1,139 @@
+import os
+import time
+from io import BytesIO
+from unittest import mock
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from ckanext.iso19115 import config, jobs, utils
+
+
+def wait(queue, job_id):
+    for _ in range(100):
+        report = queue.status(job_id)
+        if report["status"] in (jobs.FINISHED, jobs.FAILED):
+            return report
+        time.sleep(0.1)
+    raise AssertionError("Job is not finished")
+
+
+class TestLocalJobQueue:
+    def test_validation(self, examples, tmp_path, monkeypatch):
+        monkeypatch.setitem(utils.tk.config, jobs.CONFIG_CACHE_DIR, str(tmp_path))
+        queue = jobs.LocalJobQueue()
+        content = BytesIO((examples / "v3.2/sch_no_root.xml").read_bytes())
+        job_id = queue.submit(content, collect=True)
+
+        report = wait(queue, job_id)
+        assert report["status"] == jobs.FINISHED
+        assert "content" not in report
+        assert not list((tmp_path / "iso19115-uploads").iterdir())
+        assert not report["valid"]
+        assert "schematron" in report["errors"]
+        assert queue.status("not-a-job") is None
+
+    def test_timeout(self, tmp_path, monkeypatch):
+        monkeypatch.setitem(utils.tk.config, jobs.CONFIG_CACHE_DIR, str(tmp_path))
+        monkeypatch.setitem(utils.tk.config, jobs.CONFIG_VALIDATION_TIMEOUT, 0)
+        monkeypatch.setattr(jobs, "validate_document", lambda *a: time.sleep(0.5))
+        queue = jobs.LocalJobQueue()
+        job_id = queue.submit(BytesIO(b"<root/>"))
+
+        report = queue.status(job_id)
+        assert report["status"] == jobs.FAILED
+        assert "time limit" in report["errors"]["job"][0]
+
+
+class TestCkanJobQueue:
+    @pytest.fixture
+    def job(self, monkeypatch):
+        from ckan.lib import jobs as ckan_jobs
+
+        job = mock.Mock(args=["/tmp/upload.xml", False])
+        job.get_status.return_value = jobs.QUEUED
+        monkeypatch.setattr(ckan_jobs, "job_from_id", {"job": job}.__getitem__)
+        return job
+
+    def test_status(self, job):
+        job.func_name = "ckanext.iso19115.jobs.validate_document"
+        report = jobs.CkanJobQueue().status("job")
+        assert report["status"] == jobs.QUEUED
+
+    def test_foreign_job(self, job):
+        job.func_name = "ckan.lib.search.rebuild"
+        assert jobs.CkanJobQueue().status("job") is None
+        assert jobs.CkanJobQueue().status("not-a-job") is None
+
+
+def test_stale_uploads_removed(tmp_path, monkeypatch):
+    monkeypatch.setitem(utils.tk.config, jobs.CONFIG_CACHE_DIR, str(tmp_path))
+    stale = jobs.store_upload(BytesIO(b"<root/>"))
+    os.utime(stale, (0, 0))
+
+    fresh = jobs.store_upload(BytesIO(b"<root/>"))
+    assert not os.path.exists(stale)
+    with open(fresh, "rb") as src:
+        assert src.read() == b"<root/>"
+
+
+@pytest.mark.parametrize("backend", ["jobs", "local"])
+def test_get_queue(backend, monkeypatch):
+    monkeypatch.setitem(utils.tk.config, jobs.CONFIG_VALIDATION_BACKEND, backend)
+    assert jobs.get_queue() is jobs.get_queue()
+    assert isinstance(jobs.get_queue(), jobs._backends[backend])
+
+
+@pytest.mark.ckan_config(config.CONFIG_VALIDATION_BACKEND, "local")
+@pytest.mark.usefixtures("with_plugins", "clean_db")
+class TestPackageValidation:
+    @pytest.mark.ckan_config(config.CONFIG_VALIDATE_DATASETS, "true")
+    def test_submitted_after_commit(self, monkeypatch):
+        from ckan.tests import factories
+
+        submitted = []
+        monkeypatch.setattr(
+            jobs.LocalJobQueue, "submit_package", lambda q, id: submitted.append(id)
+        )
+        dataset = factories.Dataset()
+        assert submitted == [dataset["id"]]
+
+    @pytest.mark.ckan_config(config.CONFIG_STORED_ERRORS_MAX, 1)
+    def test_outcome_stored(self):
+        from ckan.tests import factories
+
+        from ckanext.iso19115.model import PackageValidation
+
+        # converter takes the publisher from the organization
+        dataset = factories.Dataset(
+            owner_org=factories.Organization()["id"], license_id="cc-by", author="[]"
+        )
+        assert PackageValidation.get(dataset["id"]) is None
+
+        result = jobs.validate_package(dataset["id"])
+        record = PackageValidation.get(dataset["id"])
+        assert record.dictize() == result
+        assert all(len(messages) <= 2 for messages in record.errors.values())
+
+    def test_missing_dataset(self):
+        assert jobs.validate_package("not-a-dataset") is None
+
+
+def test_validate_after_commit(monkeypatch):
+    submitted = []
+    monkeypatch.setattr(
+        jobs.LocalJobQueue, "submit_package", lambda q, id: submitted.append(id)
+    )
+    monkeypatch.setitem(utils.tk.config, jobs.CONFIG_VALIDATION_BACKEND, "local")
+    session = Session(create_engine("sqlite://"))
+
+    for package_id in ["first", "second", "first"]:
+        jobs.validate_after_commit(session, package_id)
+    assert not submitted
+
+    session.commit()
+    assert sorted(submitted) == ["first", "second"]
+
+    session.commit()
+    assert len(submitted) == 2
@@ -0,0 +1,74 @@
+import multiprocessing
+import os
+import pickle
+
+import pytest
+
+from ckanext.iso19115 import utils
+from ckanext.iso19115.loader import ResourceLoader
+
+
+@pytest.fixture()
+def loader():
+    return ResourceLoader(utils._root, utils._root / "namespaces.zip")
+
+
+class TestResourceLoader:
+    def test_archive_matches_extracted_files(self, loader):
+        extracted = utils._root / "namespaces"
+        if not extracted.is_dir():
+            pytest.skip("namespaces.zip is not extracted")
+
+        members = {utils._root / name for name in loader.index}
+        assert members == {p for p in extracted.rglob("*") if p.is_file()}
+        for path in members:
+            assert loader.read_bytes(path) == path.read_bytes(), path
+
+    def test_missing_archive(self, tmp_path):
+        loader = ResourceLoader(tmp_path, tmp_path / "namespaces.zip")
+        path = tmp_path / "file.xml"
+        path.write_bytes(b"<root/>")
+
+        assert not loader.contains(path)
+        assert loader.is_file(path)
+        assert loader.parse(path).getroot().tag == "root"
+
+    def test_opener(self, loader):
+        path = utils.schema_mapping[utils.DEFAULT_XSD]
+        url = path.absolute().as_uri()
+        with loader.opener().open(url) as src:
+            assert src.read() == loader.read_bytes(path)
+
+    def test_files_outside_of_archive(self, loader, tmp_path):
+        path = tmp_path / "file.xml"
+        path.write_bytes(b"<root/>")
+        assert not loader.contains(path)
+
+        with loader.opener().open(path.as_uri()) as src:
+            assert src.read() == b"<root/>"
+
+    def test_pickle(self, loader):
+        assert loader.index
+        copy = pickle.loads(pickle.dumps(loader))
+        assert copy.index.keys() == loader.index.keys()
+
+    @pytest.mark.skipif(not hasattr(os, "fork"), reason="requires fork")
+    def test_forked_readers(self):
+        # children inherit the archive opened by the parent
+        content = utils._loader.read_bytes(utils._codelists)
+
+        context = multiprocessing.get_context("fork")
+        readers = [
+            context.Process(target=_read_codelists, args=(hash(content),))
+            for _ in range(8)
+        ]
+        for reader in readers:
+            reader.start()
+        for reader in readers:
+            reader.join()
+        assert [r.exitcode for r in readers] == [0] * 8
+
+
+def _read_codelists(expected: int):
+    for _ in range(50):
+        assert hash(utils._loader.read_bytes(utils._codelists)) == expected
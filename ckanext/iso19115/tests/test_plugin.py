@@ -1,49 +1,22 @@
-"""
-Tests for plugin.py.
-
-Tests are written using the pytest library (https://docs.pytest.org), and you
-should read the testing guidelines in the CKAN docs:
-https://docs.ckan.org/en/2.9/contributing/testing.html
-
-To write tests for your extension you should install the pytest-ckan package:
-
-    pip install pytest-ckan
-
-This will allow you to use CKAN specific fixtures on your tests.
-
-For instance, if your test involves database access you can use `clean_db` to
-reset the database:
-
-    import pytest
-
-    from ckan.tests import factories
-
-    @pytest.mark.usefixtures("clean_db")
-    def test_some_action():
-
-        dataset = factories.Dataset()
-
-        # ...
-
-For functional tests that involve requests to the application, you can use the
-`app` fixture:
-
-    from ckan.plugins import toolkit
-
-    def test_some_endpoint(app):
-
-        url = toolkit.url_for('myblueprint.some_endpoint')
-
-        response = app.get(url)
-
-        assert response.status_code == 200
-
-
-To temporary patch the CKAN configuration for the duration of a test you can use:
-
-    import pytest
-
-    @pytest.mark.ckan_config("ckanext.myext.some_key", "some_value")
-    def test_some_action():
-        pass
-"""
+"""Tests for plugin.py."""
+import subprocess
+import sys
+
+import pytest
+
+HEAVY = ["xmlschema", "lxml.isoschematron", "faker", "exrex", "pycountry", "pyproj"]
+
+
+@pytest.mark.parametrize(
+    "statement",
+    [
+        "import ckanext.iso19115.plugin",
+        "from ckanext.iso19115 import cli, helpers, views; cli.get_commands()",
+        "from ckanext.iso19115.logic import action; action.get_actions()",
+    ],
+)
+def test_heavy_dependencies_are_not_imported(statement):
+    """Registration of the plugin does not load validation stack."""
+    code = f"import sys; {statement}; print(*sorted(set(sys.modules) & set({HEAVY!r})))"
+    output = subprocess.check_output([sys.executable, "-c", code], text=True)
+    assert output.strip() == ""
@@ -0,0 +1,51 @@
+from io import BytesIO
+
+import pytest
+from werkzeug.datastructures import FileStorage
+from werkzeug.test import encode_multipart
+
+from ckanext.iso19115 import config
+
+
+@pytest.fixture
+def upload(examples):
+    """Multipart body with a document bigger than 1MB."""
+    content = (examples / "v3.2/complex.xml").read_bytes()
+    document = content.replace(b"<!--", b" " * (1 << 20) + b"<!--", 1)
+    return encode_multipart({"upload": FileStorage(BytesIO(document), "record.xml")})
+
+
+@pytest.mark.usefixtures("with_plugins")
+class TestUploadLimit:
+    @pytest.mark.ckan_config(config.CONFIG_MAX_UPLOAD_SIZE, 1)
+    def test_declared_size(self, app, upload):
+        boundary, body = upload
+        resp = app.post(
+            "/-iso19115/validate",
+            data=body,
+            content_type=f"multipart/form-data; boundary={boundary}",
+            status=413,
+        )
+        assert "Document is bigger than 1MB" in resp.body
+
+    @pytest.mark.ckan_config(config.CONFIG_MAX_UPLOAD_SIZE, 1)
+    def test_chunked(self, app, upload):
+        boundary, body = upload
+        resp = app.post(
+            "/-iso19115/validate",
+            input_stream=BytesIO(body),
+            content_type=f"multipart/form-data; boundary={boundary}",
+            environ_overrides={"wsgi.input_terminated": True},
+            status=413,
+        )
+        assert "Document is bigger than 1MB" in resp.body
+
+    @pytest.mark.ckan_config(config.CONFIG_MAX_UPLOAD_SIZE, 2)
+    def test_validated(self, app, upload):
+        boundary, body = upload
+        resp = app.post(
+            "/-iso19115/validate",
+            data=body,
+            content_type=f"multipart/form-data; boundary={boundary}",
+        )
+        assert "Document is valid" in resp.body
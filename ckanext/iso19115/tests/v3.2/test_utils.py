@@ -1,5 +1,11 @@
+import hashlib
+import io
+import os
+
 import pytest
 
+from ckanext.iso19115 import config, utils, validation
+
 
 @pytest.mark.xml_example("v3.2/basic.xml")
 def test_basic(schema_errors, schematron_errors):
@@ -26,7 +32,12 @@ def test_complex(schema_errors, schematron_errors):
 
 
 class TestXsd:
-    pass
+    @pytest.mark.xml_example("v3.2/sch_no_root.xml")
+    def test_error_message(self, schema_errors):
+        assert len(schema_errors) == 1
+        path, reason = schema_errors[0].split(": ", 1)
+        assert path.startswith("/")
+        assert "xmlns" not in reason
 
 
 @pytest.mark.schematron_metadata
@@ -62,3 +73,209 @@ class TestSchIdentification:
     @pytest.mark.xml_example("v3.2/identification_no_category.xml")
     def test_identification_no_category(self, schematron_errors):
         assert schematron_errors
+
+
+@pytest.mark.parametrize(
+    "name",
+    [
+        "basic.xml",
+        "complex.xml",
+        "identification.xml",
+        "identification_no_category.xml",
+        "identification_no_geo.xml",
+        "minimal.xml",
+        "sch_no_creation_date.xml",
+        "sch_no_default_locale.xml",
+        "sch_no_root.xml",
+        "sch_non_dataset_scope.xml",
+    ],
+)
+def test_runtime_schema_conformance(examples, name):
+    """Pruned runtime schema produces the same errors as the full one."""
+    runtime = utils.get_schema(utils.DEFAULT_XSD)
+    full = utils.get_schema(f"{utils.DEFAULT_XSD}:full")
+    path = str(examples / "v3.2" / name)
+
+    def errors(schema):
+        return [(e.path, e.reason) for e in schema.iter_errors(path)]
+
+    assert errors(runtime) == errors(full)
+
+
+class TestValidationPipeline:
+    @pytest.mark.xml_example("v3.2/complex.xml")
+    def test_parsed_once(self, example, monkeypatch):
+        calls = []
+        fromstring = utils.ltree.fromstring
+
+        def parse(*args, **kwargs):
+            calls.append(args)
+            return fromstring(*args, **kwargs)
+
+        monkeypatch.setattr(utils.ltree, "fromstring", parse)
+        validation.ValidationPipeline(example).validate()
+        assert len(calls) == 1
+
+    def test_malformed_content(self):
+        pipeline = validation.ValidationPipeline(b"<mdb:MD_Metadata>")
+        with pytest.raises(utils.tk.ValidationError) as e:
+            pipeline.validate()
+        assert "content" in e.value.error_dict
+
+    @pytest.mark.parametrize("workers", [1, 4, 12])
+    @pytest.mark.xml_example("v3.2/sch_no_root.xml")
+    def test_schematron_failures_ordered(self, example, workers, monkeypatch):
+        monkeypatch.setitem(utils.tk.config, config.CONFIG_SCHEMATRON_WORKERS, workers)
+        pipeline = validation.ValidationPipeline(example)
+
+        failures = pipeline.check_schematron()
+        assert [(f.rules, f.pattern) for f in failures] == [
+            ("metadata", "rule.mdb.root-element"),
+            ("identification", "rule.mri.datasetextent"),
+        ]
+
+        with pytest.raises(utils.tk.ValidationError) as e:
+            pipeline.validate_schematron()
+        assert e.value.error_dict["schematron"] == [failures[0].message]
+
+    @pytest.mark.xml_example("v3.2/sch_no_root.xml")
+    def test_schematron_filter(self, example):
+        pipeline = validation.ValidationPipeline(example)
+        failures = pipeline.check_schematron({"identification", "extent"})
+        assert [f.rules for f in failures] == ["identification"]
+
+    def test_merged_schematron_prefixes(self):
+        merged = utils._merge_schematron(list(utils.schematron_mapping))
+        sch = {"sch": "http://purl.oclc.org/dsdl/schematron"}
+        bindings = [
+            (ns.get("prefix"), ns.get("uri")) for ns in merged.findall("sch:ns", sch)
+        ]
+
+        assert len(dict(bindings)) == len(bindings)
+        assert len({uri for _, uri in bindings}) == len(bindings)
+
+    def test_schematron_triggers(self):
+        srv = utils.ns["srv"]
+        assert utils.schematron_triggers("metadata") is None
+        assert utils.schematron_triggers("service") == {
+            f"{{{srv}}}SV_ServiceIdentification",
+            f"{{{srv}}}SV_CoupledResource",
+        }
+
+    @pytest.mark.parametrize("workers", [1, 12])
+    @pytest.mark.xml_example("v3.2/minimal.xml")
+    def test_not_applicable_rules_skipped(self, example, workers, monkeypatch):
+        monkeypatch.setitem(utils.tk.config, config.CONFIG_SCHEMATRON_WORKERS, workers)
+        fixed = utils.schematron_groups(workers)
+        groups = []
+        run = utils.run_schematron
+        monkeypatch.setattr(
+            validation,
+            "run_schematron",
+            lambda tree, names: groups.append(names) or run(tree, names),
+        )
+        pipeline = validation.ValidationPipeline(example)
+
+        pipeline.check_schematron()
+        assert groups == [
+            group for group in fixed if {"metadata", "identification"} & set(group)
+        ]
+
+        groups.clear()
+        pipeline.check_schematron(force_all=True)
+        assert groups == fixed
+
+    @pytest.mark.xml_example("v3.2/complex.xml")
+    def test_collect_errors(self, example, monkeypatch):
+        content = example.replace(
+            b'codeListValue="creation"', b'codeListValue="invalid"'
+        ).replace(b'codeListValue="pointOfContact"', b'codeListValue="invalid"')
+        pipeline = validation.ValidationPipeline(content)
+
+        failures = pipeline.check_schema(True)
+        assert [f.path.rsplit("/", 1)[-1] for f in failures] == [
+            "cit:CI_RoleCode",
+            "cit:CI_DateTypeCode",
+        ]
+
+        with pytest.raises(utils.tk.ValidationError) as e:
+            pipeline.validate(collect=True)
+        assert e.value.error_dict["schema"] == [f.message for f in failures]
+
+        monkeypatch.setitem(utils.tk.config, config.CONFIG_MAX_ERRORS, 1)
+        with pytest.raises(utils.tk.ValidationError) as e:
+            pipeline.validate_schema(True, collect=True)
+        assert e.value.error_dict["schema"][0] == failures[0].message
+        assert len(e.value.error_dict["schema"]) == 2
+
+    @pytest.mark.xml_example("v3.2/complex.xml")
+    def test_stream(self, example, monkeypatch):
+        content = example.replace(b'"creation"', b'"invalid"')
+        pipeline = validation.ValidationPipeline(io.BytesIO(content))
+
+        assert pipeline.check_schema(True, stream=True) == pipeline.check_schema(True)
+        pipeline = validation.ValidationPipeline(io.BytesIO(content))
+        monkeypatch.setattr(validation.ValidationPipeline, "tree", None)
+        with pytest.raises(utils.tk.ValidationError) as e:
+            pipeline.validate(schematron=False, stream=True)
+        assert "invalid is not a valid code" in e.value.error_dict["schema"][0]
+
+    def test_stream_malformed(self):
+        pipeline = validation.ValidationPipeline(io.BytesIO(b"<root><a></root>"))
+        with pytest.raises(utils.tk.ValidationError) as e:
+            pipeline.validate_schema(stream=True)
+        assert "content" in e.value.error_dict
+
+    @pytest.mark.xml_example("v3.2/minimal.xml")
+    def test_unseekable_source(self, example):
+        read, write = os.pipe()
+        os.write(write, example)
+        os.close(write)
+        with os.fdopen(read, "rb") as source:
+            pipeline = validation.ValidationPipeline(source)
+
+        assert pipeline.digest == hashlib.sha256(example).hexdigest()
+        pipeline.validate()
+
+    @pytest.mark.xml_example("v3.2/complex.xml")
+    def test_profile(self, example):
+        pipeline = validation.ValidationPipeline(example)
+        pipeline.validate()
+        profile = pipeline.profile()
+
+        assert profile["size"] == len(example)
+        assert profile["elements"] == len(list(pipeline.tree.iter()))
+        assert not profile["cached"]
+        assert {"parse", "schema", "codelists", "schematron"} <= set(profile["timings"])
+        assert [p for p in profile["timings"] if p.startswith("schematron:")]
+
+        pipeline = validation.ValidationPipeline(io.BytesIO(example))
+        pipeline.validate()
+        assert pipeline.profile() == {
+            "size": len(example),
+            "elements": None,
+            "cached": True,
+            "timings": {},
+        }
+
+    @pytest.mark.parametrize("size", [10, validation._SPOOL_MAX_SIZE * 2])
+    def test_spool(self, size):
+        data = b"x" * size
+        spooled = validation.spool(io.BytesIO(data), size)
+        assert spooled.seekable()
+        assert spooled.read() == data
+
+        with pytest.raises(ValueError):
+            validation.spool(io.BytesIO(data), size - 1)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_validate_files(examples, workers):
+    paths = list(validation.collect_files([str(examples / "v3.2")], "sch_*.xml"))
+    paths.append(examples / "v3.2" / "missing.xml")
+
+    reports = list(validation.validate_files(paths, workers))
+    assert [r["file"] for r in reports] == [str(p) for p in paths]
+    assert [r["ok"] for r in reports] == [False] * len(paths)
+    assert "schematron" in reports[0]["errors"]
+    assert "file" in reports[-1]["errors"]
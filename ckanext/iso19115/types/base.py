@@ -40,19 +40,18 @@ class Codelist(Generic[T]):
 
     @classmethod
     def _into_clv(cls, value: str):
-        from ..utils import codelist_options
+        from ..utils import codelist_catalogue
 
         ns, name = cls._qualify()
-        options = codelist_options(name)
+        options = codelist_catalogue().get(name)
         if not options:
             return CodeListValue(value, "")
 
-        for option in options:
-            if option.name == value:
-                return option
+        if value in options:
+            return options[value]
         raise ValueError(
             f"Codelist {ns}:{name} does not contain value {value}:"
-            f" {[o.name for o in options]}"
+            f" {list(options)}"
         )
 
     def as_jml(self):
@@ -47,12 +47,14 @@ class MD_GeometricObjects:
 
 @dataclass
 class MD_GridSpatialRepresentation(mcc.Abstract_SpatialRepresentation):
-    numberOfDimensions: gco.Integer = gco.Integer(0)
+    numberOfDimensions: gco.Integer = field(default_factory=lambda: gco.Integer(0))
     axisDimensionProperties: Optional[list[msr.MD_Dimension]] = field(
         default_factory=list
     )
     cellGeometry: Codelist[msr.MD_CellGeometryCode] = None
-    transformationParameterAvailability: gco.Boolean = gco.Boolean(False)
+    transformationParameterAvailability: gco.Boolean = field(
+        default_factory=lambda: gco.Boolean(False)
+    )
 
 
 @dataclass
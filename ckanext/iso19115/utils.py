@@ -1,12 +1,26 @@
 from __future__ import annotations
 
-import logging
 import functools
+import gc
+import hashlib
+import logging
+import math
+import os
 import pickle
-import tempfile
-from io import BytesIO
+import platform
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Container, Iterable, Optional, cast
+from typing import (
+    IO,
+    TYPE_CHECKING,
+    Any,
+    Iterable,
+    NamedTuple,
+    Optional,
+    cast,
+)
 from xml.etree import ElementTree as xtree
 
 import ckan.plugins.toolkit as tk
@@ -14,18 +28,43 @@ import xmlschema
 from lxml import etree as ltree
 from lxml import isoschematron
 
-from . import builder
-from .types.base import CodeListValue
+from .cache import (
+    ARTIFACT_VERSION,
+    cached_artifact,
+    clear_results,
+    get_cache_dir,
+    read_pickle,
+    results,
+)
+from .config import (
+    CONFIG_CACHE_DIR,
+    CONFIG_RUNTIME_ROOTS,
+    CONFIG_SCHEMATRON_WORKERS,
+    DEFAULT_RUNTIME_ROOTS,
+    DEFAULT_SCHEMATRON_WORKERS,
+)
+from .loader import ResourceLoader
+
+if TYPE_CHECKING:
+    from . import builder
+    from .types.base import CodeListValue
+
+    CodelistCatalogue = dict[str, dict[str, CodeListValue]]
 
 log = logging.getLogger(__name__)
 
-CONFIG_CACHE_DIR = "ckanext.iso19115.misc.cache_dir"
-
 DEFAULT_XSD = "mdb2"
+# see schematron_groups
+_SCHEMATRON_MAX_PATTERNS = 20
 _root = Path(__file__).parent
-_tempdir = tempfile.mkdtemp(prefix="iso19115")
+
+_loader = ResourceLoader(_root, _root / "namespaces.zip")
 
 _codelists = _root / "namespaces/19115/resources/Codelists/cat/codelists.xml"
+# published location of codelists.xml, used as `codeList` attribute of codes
+CODELIST_LOCATION = (
+    "http://standards.iso.org/iso/19115/resources/Codelists/cat/codelists.xml"
+)
 
 ns = {
     "srv": "http://standards.iso.org/iso/19115/-3/srv/2.0",
@@ -53,12 +92,18 @@ ns = {
     "xlink": "http://www.w3.org/1999/xlink",
     "xsi": "http://www.w3.org/2001/XMLSchema-instance",
 }
-_schema_mapping = {
+_meta_namespaces = {
+    "http://www.w3.org/2001/XMLSchema",
+    "http://www.w3.org/2001/XMLSchema-instance",
+    "http://www.w3.org/XML/1998/namespace",
+}
+
+schema_mapping = {
     "mds2": _root / "namespaces/19115/-3/mds/2.0/mds.xsd",
     "mdb2": _root / "namespaces/19115/-3/mdb/2.0/mdb.xsd",
 }
 
-_schematron_mapping = {
+schematron_mapping = {
     "metadata": _root / "schematron/mdb.xml",
     "identification": _root / "schematron/mri.xml",
     "constraints": _root / "schematron/mco.xml",
@@ -73,117 +118,639 @@ _schematron_mapping = {
     "measure": _root / "schematron/mdq.xml",
 }
 
-for f in _schema_mapping.values():
-    assert (
-        f.is_file()
-    ), f"Schema {f} does not exists. Have you extracted namespaces.zip?"
 
+def _get_cache_path(name: str, roots: Iterable[str] = ()) -> Path:
+    key = schema_cache_key(name)
+    if roots:
+        digest = hashlib.sha256(" ".join(sorted(roots)).encode()).hexdigest()
+        key += f"-runtime-{digest[:8]}"
+    return get_cache_dir() / f"{name}-{key}.pickle"
 
-for f in _schematron_mapping.values():
-    assert (
-        f.is_file()
-    ), f"Schema {f} does not exists. Have you extracted namespaces.zip?"
 
+def _runtime_roots() -> list[str]:
+    return tk.aslist(tk.config.get(CONFIG_RUNTIME_ROOTS, DEFAULT_RUNTIME_ROOTS))
 
-def _get_cache_path(name):
-    cache_dir = Path(tk.config.get(CONFIG_CACHE_DIR) or _tempdir)
-    cache_dir.mkdir(parents=True, exist_ok=True)
-    return cache_dir / f"{name}.pickle"
 
+def _schema_sources(name: str) -> list[Path]:
+    """Collect local XSD files reachable from the schema's root document."""
+    _xsd = "{http://www.w3.org/2001/XMLSchema}"
+    queue = [Path(os.path.abspath(schema_mapping[name]))]
+    seen: set[Path] = set()
 
-def lookup(root: str, schema: xmlschema.XMLSchema):
-    qualified_root = root
+    while queue:
+        path = queue.pop()
+        if path in seen or not _loader.is_file(path):
+            continue
+        seen.add(path)
+
+        for el in xtree.parse(_loader.open(path)).getroot():
+            if el.tag not in (f"{_xsd}include", f"{_xsd}import", f"{_xsd}redefine"):
+                continue
+            location = el.get("schemaLocation")
+            if not location or "://" in location:
+                continue
+            queue.append(Path(os.path.normpath(path.parent / location)))
 
+    return sorted(seen)
+
+
+@functools.lru_cache()
+def schema_cache_key(name: str) -> str:
+    """Digest of the schema sources and of the tools used for compilation.
+
+    Any change of XSD files or upgrade of xmlschema/lxml/Python produces a new
+    key, so stale pickles are never loaded.
+    """
+    digest = hashlib.sha256()
+    for version in [
+        ARTIFACT_VERSION,
+        xmlschema.__version__,
+        ltree.__version__,
+        platform.python_implementation(),
+        platform.python_version(),
+    ]:
+        digest.update(version.encode())
+
+    root = os.path.abspath(schema_mapping[name].parent)
+    for path in _schema_sources(name):
+        digest.update(os.path.relpath(path, root).encode())
+        digest.update(_loader.read_bytes(path))
+
+    return digest.hexdigest()[:16]
+
+
+def _qualify(name: str) -> str:
+    """Convert prefixed name into qualified one."""
     try:
-        _ns, tag = root.split(":")
-        qualified_root = "{%s}%s" % (ns[_ns], tag)
+        _ns, tag = name.split(":")
+        return "{%s}%s" % (ns[_ns], tag)
     except (ValueError, KeyError):
-        pass
+        return name
 
-    el = None
 
-    if root in schema.maps.elements:
-        el = schema.maps.elements[root]
-    else:
-        for component in schema.maps.iter_components():
-            if not hasattr(component, "qualified_name"):
+def lookup(root: str, schema: xmlschema.XMLSchema):
+    index = schemas.index_of(schema)
+    return index.lookup(root) or index.lookup(_qualify(root))
+
+
+class ComponentIndex:
+    """Lookup table of schema components.
+
+    Components are available by qualified(`{namespace}name`) and prefixed
+    (`mdb:MD_Metadata`, using prefixes from `ns`) names. Global elements
+    have priority over global types and groups, which have priority over
+    local components.
+    """
+
+    def __init__(self, schema: xmlschema.XMLSchema):
+        self.components: dict[str, Any] = {}
+        self.enumerations: dict[str, xmlschema.XsdElement] = {}
+        self._prefixes = {uri: prefix for prefix, uri in ns.items()}
+
+        maps = schema.maps
+        for components in [maps.elements, maps.types, maps.groups]:
+            for qname, component in components.items():
+                self._add(qname, component)
+
+        for component in maps.iter_components():
+            qname = getattr(component, "qualified_name", None)
+            if qname:
+                self._add(qname, component)
+
+        for el in maps.elements.values():
+            if (
+                isinstance(el, xmlschema.XsdElement)
+                and el.type.is_simple()
+                and getattr(el.type, "enumeration", None)
+            ):
+                self.enumerations[el.local_name] = el
+
+    def _add(self, qname: str, component: Any):
+        self.components.setdefault(qname, component)
+        if not qname.startswith("{"):
+            return
+
+        uri, name = qname[1:].split("}")
+        if uri in self._prefixes:
+            self.components.setdefault(f"{self._prefixes[uri]}:{name}", component)
+
+    def lookup(self, name: str) -> Any:
+        return self.components.get(name)
+
+
+class SchemaArtifact(NamedTuple):
+    schema: xmlschema.XMLSchema
+    index: ComponentIndex
+
+
+class SchemaRegistry:
+    """Per-process storage of compiled XSD schemas.
+
+    Deserializing the pickled schema is expensive, so every schema is loaded
+    only once and then kept in memory until it's explicitly invalidated.
+    Builders refer to the loaded schemas, so they are stored here as well and
+    dropped together with schemas.
+    """
+
+    def __init__(self):
+        self._artifacts: dict[str, SchemaArtifact] = {}
+        self._builders: dict[tuple[str, str], builder.Builder] = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, name: str):
+        return name in self._artifacts
+
+    def artifact(self, name: str, rebuild: bool = False) -> SchemaArtifact:
+        """Return compiled schema with its index, loading it on the first access."""
+        with self._lock:
+            if not rebuild and name in self._artifacts:
+                self.hits += 1
+                return self._artifacts[name]
+
+            self.misses += 1
+            artifact = _load_schema(name, rebuild)
+            self._artifacts[name] = artifact
+            self._drop_derived()
+
+        return artifact
+
+    def get(self, name: str, rebuild: bool = False) -> xmlschema.XMLSchema:
+        """Return compiled schema, loading it on the first access."""
+        return self.artifact(name, rebuild).schema
+
+    def builder(self, root: str, name: str) -> builder.Builder:
+        """Return builder for the root element, creating it on the first access.
+
+        Builders do not keep any state between calls, so the same instance
+        is shared by all threads.
+        """
+        key = (root, name)
+        instance = self._builders.get(key)
+        if instance is not None:
+            return instance
+
+        with self._lock:
+            if key not in self._builders:
+                schema = self.get(name)
+                if lookup(root, schema) is None:
+                    # root is not reachable from the runtime roots
+                    schema = self.get(f"{name}:full")
+                from .builder import Builder
+
+                self._builders[key] = Builder(schema, root)
+            return self._builders[key]
+
+    def index_of(self, schema: xmlschema.XMLSchema) -> ComponentIndex:
+        """Return index of the schema, building it if schema is unknown."""
+        for artifact in list(self._artifacts.values()):
+            if artifact.schema is schema:
+                return artifact.index
+        return ComponentIndex(schema)
+
+    def reload(self, name: Optional[str] = None):
+        """Replace schema (or all loaded schemas) with a fresh copy from cache."""
+        names = [name] if name else list(self._artifacts)
+        with self._lock:
+            for item in names:
+                self._artifacts[item] = _load_schema(item)
+            self._drop_derived()
+
+    def invalidate(self, name: Optional[str] = None):
+        """Drop schema (or all schemas) from memory."""
+        with self._lock:
+            if name:
+                self._artifacts.pop(name, None)
+            else:
+                self._artifacts.clear()
+            self._drop_derived()
+
+    def _drop_derived(self):
+        self._builders.clear()
+        enum_values.cache_clear()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "loaded": sorted(self._artifacts),
+                "builders": len(self._builders),
+            }
+
+
+def _build_schema(name: str) -> xmlschema.XMLSchema:
+    source = schema_mapping[name]
+    if not _loader.is_file(source):
+        raise FileNotFoundError(f"Schema {source} does not exist")
+
+    # sources are read from namespaces.zip, extracted files are not shipped
+    return xmlschema.XMLSchema(str(source), validation="lax", opener=_loader.opener())
+
+
+def _iter_references(component: Any) -> Iterable[Any]:
+    """Yield components used by the given one.
+
+    Attributes pointing back to the owner(parent, schema, global maps) are
+    ignored, so that only the dependencies of component are collected.
+    """
+    skip = {"parent", "schema", "maps", "builders", "elem", "errors", "selected_by"}
+    attrs = dict(getattr(component, "__dict__", {}))
+    for cls in type(component).__mro__:
+        for slot in getattr(cls, "__slots__", None) or ():
+            if slot not in attrs and hasattr(component, slot):
+                attrs[slot] = getattr(component, slot)
+
+    queue = [v for k, v in attrs.items() if k not in skip]
+    while queue:
+        value = queue.pop()
+        if isinstance(value, xmlschema.XsdComponent):
+            yield value
+        elif isinstance(value, dict):
+            queue.extend(value.values())
+        elif isinstance(value, (list, tuple, set, frozenset)):
+            queue.extend(value)
+
+
+def _prune_schema(
+    schema: xmlschema.XMLSchema, roots: Iterable[str]
+) -> xmlschema.XMLSchema:
+    """Drop global components that cannot be reached from the root elements.
+
+    Members of substitution groups are reachable from the group head. Lax
+    wildcards(content of xs:anyType or gml:metaDataProperty) do not extend
+    reachable area, so their content is validated only against the retained
+    declarations. Components of XSD, XSI and XML namespaces are always kept.
+    """
+    maps = schema.maps
+    queue = [
+        maps.elements.get(_qualify(root)) or lookup(root, schema) for root in roots
+    ]
+    reachable: set[int] = set()
+
+    while queue:
+        component = queue.pop()
+        if component is None or id(component) in reachable:
+            continue
+        reachable.add(id(component))
+        queue.extend(_iter_references(component))
+        if isinstance(component, xmlschema.XsdElement):
+            queue.extend(maps.substitution_groups.get(component.name, ()))
+
+    for attr in ["types", "elements", "groups", "attributes"]:
+        components = getattr(maps, attr)
+        # xmlschema v4 keeps built components inside the private store
+        store = getattr(components, "_store", components)
+        for qname in list(store):
+            if id(store[qname]) in reachable:
+                continue
+            if qname.startswith("{") and qname[1:].split("}")[0] in _meta_namespaces:
                 continue
-            if component.qualified_name == qualified_root:
-                el = component
-                break
+            del store[qname]
 
-    # el = schema.find(f".//{root}", namespaces=utils.ns)
-    return el
+    for head, members in list(maps.substitution_groups.items()):
+        if id(maps.elements.get(head)) not in reachable:
+            del maps.substitution_groups[head]
+            continue
+        maps.substitution_groups[head] = type(members)(
+            m for m in members if id(m) in reachable
+        )
 
+    return schema
 
-def _get_schema(name: str, rebuild: bool = False) -> xmlschema.XMLSchema:
-    cache = _get_cache_path(name)
-    if not cache.is_file() or rebuild:
-        log.info("Building the cache at %s...", cache)
-        schema = xmlschema.XMLSchema(str(_schema_mapping[name]), validation="lax")
-        with cache.open("wb") as dest:
-            pickle.dump(schema, dest)
-    with cache.open("rb") as src:
-        return pickle.load(src)
+
+def _build_runtime_schema(name: str, roots: Iterable[str]) -> xmlschema.XMLSchema:
+    # pruning mutates schema, so don't touch the copy from the registry
+    schema = _load_schema(f"{name}:full").schema
+    return _prune_schema(schema, roots)
+
+
+def _load_schema(name: str, rebuild: bool = False) -> SchemaArtifact:
+    """Load a pickled schema, building it when necessary.
+
+    `<name>` is a runtime schema, pruned by reachability from the configured
+    root elements. `<name>:full` is a complete schema.
+    """
+    name, _sep, variant = name.partition(":")
+    roots = [] if variant == "full" else _runtime_roots()
+
+    def build() -> SchemaArtifact:
+        schema = _build_runtime_schema(name, roots) if roots else _build_schema(name)
+        # index is pickled together with schema to share references to components
+        return SchemaArtifact(schema, ComponentIndex(schema))
+
+    # runtime and full variants are kept together, the latter is required to
+    # build the former
+    variants = (
+        _get_cache_path(name).name,
+        _get_cache_path(name, _runtime_roots()).name,
+    )
+    return cached_artifact(
+        _get_cache_path(name, roots),
+        build,
+        family=f"{name}*.pickle",
+        read=_read_schema,
+        write=_write_schema,
+        rebuild=rebuild,
+        keep=variants,
+    )
+
+
+def _read_schema(path: Path) -> Optional[SchemaArtifact]:
+    data = read_pickle(path)
+    return None if data is None else SchemaArtifact(*data)
+
+
+def _write_schema(artifact: SchemaArtifact, dest: IO[bytes]):
+    # plain tuple does not depend on the location of SchemaArtifact
+    pickle.dump(tuple(artifact), dest)
+
+
+schemas = SchemaRegistry()
+
+
+def get_schema(name: str, rebuild: bool = False) -> xmlschema.XMLSchema:
+    return schemas.get(name, rebuild)
 
 
 def get_builder(root, name: str = DEFAULT_XSD) -> builder.Builder:
-    schema = _get_schema(name)
-    return builder.Builder(schema, root)
+    return schemas.builder(root, name)
 
 
-def validate_schema(
-    content: bytes, name: str = DEFAULT_XSD, validate_codelists: bool = False
-):
-    schema = _get_schema(name)
+@functools.lru_cache()
+def validation_stamp(name: str = DEFAULT_XSD) -> str:
+    """Version of everything that affects the outcome of validation.
+
+    Stamp changes whenever schema, codelists or schematron rules are modified,
+    so cached results of validation never outlive the rules that produced them.
+    """
+    digest = hashlib.sha256(ARTIFACT_VERSION.encode())
+    for key in [
+        schema_cache_key(name),
+        " ".join(_runtime_roots()),
+        codelist_cache_key(),
+        schematron_cache_key(schematron_mapping),
+    ]:
+        digest.update(key.encode())
+    return digest.hexdigest()[:16]
+
+
+class SchematronFailure(NamedTuple):
+    rules: str
+    pattern: str
+    location: str
+    message: str
+
+
+_svrl = "{http://purl.oclc.org/dsdl/svrl}"
+
+
+def run_schematron(tree: Any, names: tuple[str, ...]) -> list[SchematronFailure]:
+    report = _get_schematron(names)(tree)
+
+    failures = []
+    pattern = ""
+    for el in report.getroot():
+        if el.tag == f"{_svrl}active-pattern":
+            pattern = el.get("id", "")
+        elif el.tag == f"{_svrl}failed-assert":
+            rules, _sep, pattern_id = pattern.partition(".")
+            message = " ".join(
+                " ".join(l.strip() for l in child.itertext())
+                for child in el
+                if child.text
+            )
+            failures.append(
+                SchematronFailure(rules, pattern_id, el.get("location", ""), message)
+            )
+
+    return failures
+
+
+@functools.lru_cache()
+def schematron_groups(workers: int) -> list[tuple[str, ...]]:
+    """Split rule sets into contiguous groups, compiled into one validator each.
+
+    Groups depend only on the number of workers, never on the validated
+    document, so the set of compiled validators is fixed and can be built in
+    advance by `warm_cache`. There is at least one group per thread. libxslt
+    checks catch-all templates of every pattern for each visited node, so a
+    validator merged from too many patterns gets slower than a couple of
+    smaller ones. Because of it, groups are also limited by the number of
+    patterns.
+    """
+    names = list(schematron_mapping)
+    patterns = sum(_count_patterns(name) for name in names)
+    size = max(workers, math.ceil(patterns / _SCHEMATRON_MAX_PATTERNS))
+    size = max(1, min(size, len(names)))
+    return [
+        tuple(names[idx * len(names) // size : (idx + 1) * len(names) // size])
+        for idx in range(size)
+    ]
+
+
+@functools.lru_cache(None)
+def schematron_triggers(name: str) -> Optional[frozenset[str]]:
+    """Elements that must be present in the document to fire any rule.
+
+    Every branch of the rule's context can match only when the document
+    contains the element from the last named step of the branch, e.g.
+    `//srv:SV_CoupledResource[srv:resource]` requires SV_CoupledResource.
+    None means that the rule set applies to every document, e.g. when it has
+    a rule for the document root or when context is too complex to analyze.
+    """
+    sch = "{http://purl.oclc.org/dsdl/schematron}"
+    rules = _loader.parse(schematron_mapping[name]).getroot()
+    prefixes = {el.get("prefix"): el.get("uri") for el in rules.iter(f"{sch}ns")}
+
+    triggers = set()
+    for rule in rules.iter(f"{sch}rule"):
+        context = _strip_predicates(rule.get("context", ""))
+        for branch in context.split("|"):
+            steps = [
+                step.strip()
+                for step in branch.split("/")
+                if step.strip() not in ("", "*", ".", "..")
+            ]
+            if not steps:
+                return None
+
+            prefix, _sep, local = steps[-1].rpartition(":")
+            if prefix not in prefixes or not re.fullmatch(r"[\w.-]+", local):
+                return None
+            triggers.add(f"{{{prefixes[prefix]}}}{local}")
+
+    return frozenset(triggers)
+
+
+def _strip_predicates(expr: str) -> str:
+    result = []
+    depth = 0
+    for char in expr:
+        if char == "[":
+            depth += 1
+        elif char == "]":
+            depth -= 1
+        elif not depth:
+            result.append(char)
+    return "".join(result)
+
+
+@functools.lru_cache(None)
+def _count_patterns(name: str) -> int:
+    rules = _loader.parse(schematron_mapping[name]).getroot()
+    return len(rules.findall("{http://purl.oclc.org/dsdl/schematron}pattern"))
+
+
+_executor: Optional[tuple[tuple[int, int], ThreadPoolExecutor]] = None
+_executor_lock = threading.Lock()
+
+
+def configured_schematron_workers() -> int:
+    workers = tk.asint(
+        tk.config.get(CONFIG_SCHEMATRON_WORKERS, DEFAULT_SCHEMATRON_WORKERS)
+    )
+    if not workers:
+        workers = min(len(schematron_mapping), os.cpu_count() or 1)
+    return workers
+
+
+def get_schematron_executor(workers: int) -> ThreadPoolExecutor:
+    """Thread pool for schematron rule sets.
+
+    lxml releases GIL while XSLT is applied, so groups of rule sets are
+    checked concurrently. Threads do not survive fork, so every process gets
+    its own pool.
+    """
+    global _executor
+
+    key = (os.getpid(), workers)
+    with _executor_lock:
+        if _executor is None or _executor[0] != key:
+            _executor = (
+                key,
+                ThreadPoolExecutor(workers, thread_name_prefix="iso19115-schematron"),
+            )
+        return _executor[1]
+
+
+def _merge_schematron(names: Iterable[str]) -> Any:
+    """Combine rule sets into a single schematron document.
+
+    Patterns are copied in the order of rule sets and their IDs are prefixed
+    with the name of the rule set, e.g. `metadata.rule.mdb.root-element`, so
+    that failed assertions can be attributed to the rule set. Rule sets bind
+    the same prefixes to different versions of namespaces, so conflicting
+    prefixes are renamed inside XPath expressions of the pattern.
+    """
+    sch = "{http://purl.oclc.org/dsdl/schematron}"
+    merged = ltree.Element(f"{sch}schema", nsmap={"sch": sch[1:-1]})
+    prefixes: dict[str, str] = {}
+    patterns = []
+
+    for name in names:
+        rules = _loader.parse(schematron_mapping[name]).getroot()
+
+        renamed = {}
+        for el in rules.iterchildren(f"{sch}ns"):
+            prefix, uri = el.get("prefix"), el.get("uri")
+            if uri not in prefixes:
+                unique = prefix
+                idx = 1
+                while unique in prefixes.values():
+                    unique = f"{prefix}{idx}"
+                    idx += 1
+                prefixes[uri] = unique
+                ltree.SubElement(merged, f"{sch}ns", prefix=unique, uri=uri)
+
+            if prefixes[uri] != prefix:
+                renamed[prefix] = prefixes[uri]
+
+        for idx, pattern in enumerate(rules.iterchildren(f"{sch}pattern")):
+            pattern.set("id", pattern.get("id") or str(idx))
+            # IDs must be unique inside the merged document
+            for el in pattern.iter(f"{sch}*"):
+                if el.get("id"):
+                    el.set("id", f"{name}.{el.get('id')}")
+            if renamed:
+                _rename_prefixes(pattern, renamed)
+            patterns.append(pattern)
+
+    # all namespaces must be declared before the first pattern
+    merged.extend(patterns)
+    return ltree.ElementTree(merged)
+
+
+def _rename_prefixes(pattern: Any, renamed: dict[str, str]):
+    expr = re.compile(r"(?<![\w.-])(%s):(?=[\w*])" % "|".join(map(re.escape, renamed)))
+    for el in pattern.iter():
+        for attr in ["context", "test", "value", "select", "path", "subject"]:
+            value = el.get(attr)
+            if value:
+                el.set(attr, expr.sub(lambda m: renamed[m.group(1)] + ":", value))
+
+
+@functools.lru_cache(32)
+def _get_schematron(names: tuple[str, ...]) -> ltree.XSLT:
+    """Compile rule sets into a single validating XSLT.
+
+    Validator is a plain XSLT instead of `isoschematron.Schematron`, because
+    the latter keeps the report of the last validation as an attribute and
+    cannot be shared between threads.
+    """
+
+    def build() -> Any:
+        sch = isoschematron.Schematron(_merge_schematron(names), store_xslt=True)
+        return sch.validator_xslt
+
+    xslt = cached_artifact(
+        _get_schematron_cache_path(names),
+        build,
+        family=f"schematron-{_schematron_group_id(names)}-*.xsl",
+        read=_read_xslt,
+        write=lambda xslt, dest: xslt.write(dest, method="xml"),
+    )
+    return ltree.XSLT(xslt)
+
+
+def _read_xslt(path: Path) -> Optional[Any]:
     try:
-        # from icecream import ic
+        return ltree.parse(str(path))
+    except ltree.XMLSyntaxError:
+        log.exception("Cannot load the cache from %s", path)
+        return None
 
-        # ic(
-        #     schema.decode(
-        #         BytesIO(content), converter=xmlschema.JsonMLConverter
-        #     )
-        # )
 
-        schema.validate(
-            BytesIO(content),
-            extra_validator=get_extra_validator(validate_codelists),
-        )
-    except xmlschema.XMLSchemaValidationError as e:
-        raise tk.ValidationError({"schema": [str(e)]})
-    except (ValueError, xtree.ParseError) as e:
-        raise tk.ValidationError({"content": [str(e)]})
-
-
-def validate_schematron(content: bytes, schemas: Iterable[str] = frozenset()):
-    errors = []
-    if not schemas:
-        schemas = _schematron_mapping.keys()
-    for name in schemas:
-        path = str(_schematron_mapping[name])
-        with open(path, "rb") as src:
-            sch = isoschematron.Schematron(ltree.XML(src.read()), store_report=True)
-        if sch.validate(ltree.XML(content)):
-            continue
+def schematron_cache_key(names: Iterable[str]) -> str:
+    """Digest of schematron rules and lxml that compiles them into XSLT."""
+    digest = hashlib.sha256(ARTIFACT_VERSION.encode())
+    digest.update(ltree.__version__.encode())
+    for name in names:
+        digest.update(name.encode())
+        digest.update(_loader.read_bytes(schematron_mapping[name]))
+    return digest.hexdigest()[:16]
+
+
+def _schematron_group_id(names: Iterable[str]) -> str:
+    return "+".join(schematron_mapping[name].stem for name in names)
 
-        failed = sch.validation_report.xpath(
-            "//*[local-name() = 'failed-assert']/*[text()]"
-        )
-        errors.extend(" ".join(l.strip() for l in f.itertext()) for f in failed)
-    if errors:
-        raise tk.ValidationError({"schematron": list(set(errors))})
+
+def _get_schematron_cache_path(names: tuple[str, ...]) -> Path:
+    group = _schematron_group_id(names)
+    return get_cache_dir() / f"schematron-{group}-{schematron_cache_key(names)}.xsl"
 
 
 def validate_codelist(el: xtree.Element, xsd: xmlschema.XMLSchemaBase):
     if xsd.type.local_name != "CodeListValue_Type":
         return
-    if xsd.local_name not in codelist_names():
+    options = codelist_catalogue().get(xsd.local_name)
+    if options is None:
         return
 
-    validOptions = {c.name for c in codelist_options(xsd.local_name)}
     value = el.attrib["codeListValue"]
-    if value not in validOptions:
-        reason = f"{value} is not a valid code. Valid options are: {validOptions}"
+    if value not in options:
+        reason = f"{value} is not a valid code. Valid options are: {sorted(options)}"
         raise xmlschema.XMLSchemaValidationError(xsd, el, reason)
 
 
@@ -196,41 +763,67 @@ def get_extra_validator(codelists: bool):
 
 
 @functools.lru_cache(1)
-def codelist_names() -> Container[str]:
-    xml = ltree.XML(_codelists.open("rb").read())
-    xpath = f"//cat:codelistItem/cat:CT_Codelist/@id"
-    namespaces = {"cat": xml.nsmap["cat"]}
-    return xml.xpath(xpath, namespaces=namespaces)
+def codelist_cache_key() -> str:
+    """Digest of codelists.xml and of the format of the pickled catalogue."""
+    digest = hashlib.sha256(ARTIFACT_VERSION.encode())
+    digest.update(platform.python_version().encode())
+    digest.update(_loader.read_bytes(_codelists))
+    return digest.hexdigest()[:16]
 
 
-@functools.lru_cache()
-def codelist_options(name: str) -> list[CodeListValue]:
-    xml = ltree.XML(_codelists.open("rb").read())
-    xpath = f"//cat:codelistItem/cat:CT_Codelist[@id='{name}']/cat:codeEntry/cat:CT_CodelistValue"
-    namespaces = {"cat": xml.nsmap["cat"], "gco": xml.nsmap["gco"]}
-    codes = xml.xpath(xpath, namespaces=namespaces)
+def _get_codelist_cache_path() -> Path:
+    return get_cache_dir() / f"codelists-{codelist_cache_key()}.pickle"
 
-    return [
-        CodeListValue(
-            code.find(
-                "cat:identifier/gco:ScopedName", namespaces=namespaces
-            ).text.strip(),
-            code.find("cat:definition/gco:CharacterString", namespaces=namespaces).text,
-        )
-        for code in codes
-    ]
+
+def _build_codelist_catalogue() -> CodelistCatalogue:
+    from .types.base import CodeListValue
+
+    xml = _loader.parse(_codelists).getroot()
+    namespaces = {"cat": ns["cat"], "gco": ns["gco"]}
+    catalogue: CodelistCatalogue = {}
+
+    for codelist in xml.iterfind("cat:codelistItem/cat:CT_Codelist", namespaces):
+        name = codelist.get("id")
+        location = f"{CODELIST_LOCATION}#{name}"
+        catalogue[name] = {}
+        for code in codelist.iterfind("cat:codeEntry/cat:CT_CodelistValue", namespaces):
+            value = code.findtext("cat:identifier/gco:ScopedName", "", namespaces)
+            definition = code.findtext(
+                "cat:definition/gco:CharacterString", None, namespaces
+            )
+            catalogue[name][value.strip()] = CodeListValue(
+                value.strip(), definition, location
+            )
+
+    return catalogue
+
+
+@functools.lru_cache(1)
+def codelist_catalogue() -> CodelistCatalogue:
+    """Values of every codelist, parsed from codelists.xml at once.
+
+    Catalogue maps name of the codelist to the mapping of code values into
+    `CodeListValue`. It's pickled into the cache directory next to schemas.
+    """
+    return cached_artifact(
+        _get_codelist_cache_path(),
+        _build_codelist_catalogue,
+        family="codelists-*.pickle",
+    )
 
 
 @functools.lru_cache(1)
+def codelist_names() -> frozenset[str]:
+    return frozenset(codelist_catalogue())
+
+
+@functools.lru_cache()
+def codelist_options(name: str) -> list[CodeListValue]:
+    return list(codelist_catalogue().get(name, {}).values())
+
+
 def enum_elements(name: str = DEFAULT_XSD) -> dict[str, xmlschema.XsdElement]:
-    schema = _get_schema(name)
-    return {
-        e.local_name: e
-        for e in schema.maps.elements.values()
-        if isinstance(e, xmlschema.XsdElement)
-        and e.type.is_simple()
-        and getattr(e.type, "enumeration", None)
-    }
+    return schemas.artifact(name).index.enumerations
 
 
 @functools.lru_cache()
@@ -239,3 +832,94 @@ def enum_values(name: str, schema: str = DEFAULT_XSD) -> Optional[list[Any]]:
     if el.local_name == name:
         type_ = cast(xmlschema.validators.simple_types.XsdAtomicRestriction, el.type)
         return type_.enumeration
+
+
+def warm_cache(
+    names: Iterable[str] = (DEFAULT_XSD,), schematron_workers: Optional[int] = None
+):
+    """Compile schemas, codelists and schematron validators in advance.
+
+    Schematron groups depend on the number of workers, so validators are
+    compiled for `schematron_workers` if it's different from the configured
+    value.
+    """
+    for name in names:
+        get_schema(name)
+        # reads sources from the archive, so forked workers don't have to
+        validation_stamp(name)
+
+    codelist_catalogue()
+
+    if schematron_workers is None:
+        schematron_workers = configured_schematron_workers()
+    for group in schematron_groups(schematron_workers):
+        _get_schematron(group)
+
+
+def preload(names: Iterable[str] = (DEFAULT_XSD,)):
+    """Load everything into memory and freeze the heap before forking.
+
+    Call it from the master process of a pre-forking server. Frozen objects
+    are ignored by GC, so workers don't touch (and copy) memory pages holding
+    the compiled schema.
+    """
+    warm_cache(names)
+    gc.collect()
+    gc.freeze()
+    log.info(
+        "Preloaded %s objects into the permanent generation", gc.get_freeze_count()
+    )
+
+
+def cache_files() -> list[Path]:
+    """List files created inside the cache directory."""
+    cache_dir = get_cache_dir()
+    files: list[Path] = []
+    # lock files are never removed, another process may hold them
+    for name in schema_mapping:
+        files.extend(cache_dir.glob(f"{name}.pickle"))
+        files.extend(cache_dir.glob(f"{name}-*.pickle"))
+    files.extend(cache_dir.glob("codelists-*.pickle"))
+    files.extend(cache_dir.glob("schematron-*.xsl"))
+
+    return sorted(files)
+
+
+def cache_status() -> dict[str, Any]:
+    """Describe the state of persistent and in-process caches."""
+    return {
+        "cache_dir": str(get_cache_dir()),
+        "persistent": bool(tk.config.get(CONFIG_CACHE_DIR)),
+        "schemas": {
+            name: {
+                "path": str(_get_cache_path(name)),
+                "built": _get_cache_path(name).is_file(),
+                "loaded": name in schemas,
+            }
+            for name in schema_mapping
+        },
+        "registry": schemas.stats(),
+        "codelists": (
+            len(codelist_catalogue()) if codelist_catalogue.cache_info().currsize else 0
+        ),
+        "schematron": _get_schematron.cache_info().currsize,
+        "results": results.stats(),
+    }
+
+
+def clear_cache() -> list[Path]:
+    """Remove cached files and drop everything loaded into memory."""
+    removed = cache_files()
+    for path in removed:
+        path.unlink()
+
+    removed.extend(clear_results())
+
+    schemas.invalidate()
+    codelist_catalogue.cache_clear()
+    codelist_names.cache_clear()
+    codelist_options.cache_clear()
+    _get_schematron.cache_clear()
+    validation_stamp.cache_clear()
+
+    return removed
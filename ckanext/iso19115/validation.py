@@ -0,0 +1,618 @@
+"""Validation of ISO 19115 documents against XSD, codelists and schematron.
+
+Compiled schemas, codelists and schematron validators come from `utils`,
+outcomes of validation are kept in the result cache from `cache`.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import functools
+import glob
+import hashlib
+import itertools
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    NamedTuple,
+    Optional,
+    Union,
+    cast,
+)
+from xml.etree import ElementTree as xtree
+
+import ckan.plugins.toolkit as tk
+import xmlschema
+from lxml import etree as ltree
+
+from .cache import result_cache_size, results
+from .config import (
+    CONFIG_MAX_ERRORS,
+    CONFIG_SCHEMATRON_FORCE_ALL,
+    CONFIG_SCHEMATRON_WORKERS,
+    DEFAULT_MAX_ERRORS,
+)
+from .utils import (
+    DEFAULT_XSD,
+    SchematronFailure,
+    configured_schematron_workers,
+    get_extra_validator,
+    get_schema,
+    get_schematron_executor,
+    run_schematron,
+    schematron_groups,
+    schematron_mapping,
+    schematron_triggers,
+    validation_stamp,
+    warm_cache,
+)
+
+# documents bigger than this are spooled to disk, see spool
+_SPOOL_MAX_SIZE = 1 << 20
+# schematron threads of validation_pool workers. Every process already
+# occupies a CPU
+_VALIDATION_WORKER_THREADS = 1
+
+# pool of the process that created it, see shared_validation_pool
+_shared_pool: Optional[tuple[int, ProcessPoolExecutor]] = None
+_shared_pool_lock = threading.Lock()
+
+
+def _is_seekable(source: IO[bytes]) -> bool:
+    # werkzeug spools uploads into SpooledTemporaryFile, which has no
+    # `seekable` before python v3.11, but can be rewound
+    if isinstance(source, tempfile.SpooledTemporaryFile):
+        return True
+    seekable = getattr(source, "seekable", None)
+    return bool(seekable and seekable())
+
+
+def spool(source: IO[bytes], limit: Optional[int] = None) -> IO[bytes]:
+    """Copy the stream into a seekable file object.
+
+    Small documents are kept in memory and big ones are written into a
+    temporary file. ValueError is raised as soon as more than `limit` bytes
+    are read.
+    """
+    head = source.read(_SPOOL_MAX_SIZE)
+    if limit is not None and len(head) > limit:
+        raise ValueError(f"Document is bigger than {limit} bytes")
+    if len(head) < _SPOOL_MAX_SIZE:
+        return BytesIO(head)
+
+    # SpooledTemporaryFile is not used, because it's not a proper file
+    # object (it has no `seekable`) before python v3.11
+    dest = cast(IO[bytes], tempfile.TemporaryFile())
+    size = len(head)
+    while head:
+        dest.write(head)
+        head = source.read(1 << 16)
+        size += len(head)
+        if limit is not None and size > limit:
+            dest.close()
+            raise ValueError(f"Document is bigger than {limit} bytes")
+
+    dest.seek(0)
+    return dest
+
+
+class ValidationPipeline:
+    """Validation of a single XML document.
+
+    Document is parsed into lxml tree on the first access and the same tree is
+    used by XSD, codelist and schematron checks.
+
+    Content is either bytes or a binary file object. Non-seekable streams
+    (e.g. STDIN) are spooled into a temporary file, because the document is
+    read more than once. With file object, XSD and codelists can be checked in
+    `stream` mode, without building the whole tree.
+
+    Duration of every phase is recorded into `timings`, see `profile`.
+    """
+
+    def __init__(self, content: Union[bytes, IO[bytes]], name: str = DEFAULT_XSD):
+        if not isinstance(content, bytes) and not _is_seekable(content):
+            content = spool(content)
+        self.content = content
+        self.name = name
+        self.timings: dict[str, float] = {}
+        self.cached = False
+
+    @contextlib.contextmanager
+    def _timer(self, phase: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[phase] = (
+                self.timings.get(phase, 0) + time.perf_counter() - start
+            )
+
+    def profile(self) -> dict[str, Any]:
+        """Size of the document, number of elements and duration of phases.
+
+        Timings are in seconds. Rule sets are compiled into groups, so
+        schematron is timed per group, e.g. `schematron:metadata+identification`.
+        Groups run concurrently, so their sum may exceed `schematron` total.
+        Number of elements is known only when document was parsed into tree.
+        """
+        if isinstance(self.content, bytes):
+            size = len(self.content)
+        else:
+            size = self.content.seek(0, os.SEEK_END)
+
+        elements = None
+        if "tree" in self.__dict__:
+            elements = sum(1 for _el in self.tree.iter())
+
+        return {
+            "size": size,
+            "elements": elements,
+            "cached": self.cached,
+            "timings": dict(self.timings),
+        }
+
+    @functools.cached_property
+    def tree(self) -> Any:
+        # entities are not expanded and nothing is downloaded, same as inside
+        # xmlschema's own parser
+        parser = ltree.XMLParser(resolve_entities=False, no_network=True)
+        try:
+            with self._timer("parse"):
+                return self._parse(parser)
+        except (ValueError, ltree.XMLSyntaxError) as e:
+            raise tk.ValidationError({"content": [str(e)]})
+
+    def _parse(self, parser: Any) -> Any:
+        if isinstance(self.content, bytes):
+            return ltree.ElementTree(ltree.fromstring(self.content, parser))
+        self.content.seek(0)
+        return ltree.parse(self.content, parser)
+
+    @functools.cached_property
+    def digest(self) -> str:
+        """SHA-256 of the document."""
+        if isinstance(self.content, bytes):
+            return hashlib.sha256(self.content).hexdigest()
+
+        digest = hashlib.sha256()
+        self.content.seek(0)
+        for chunk in iter(functools.partial(self.content.read, 1 << 16), b""):
+            digest.update(chunk)
+        return digest.hexdigest()
+
+    def validate(
+        self,
+        codelists: bool = True,
+        schematron: bool = True,
+        collect: bool = False,
+        stream: bool = False,
+    ):
+        """Run all requested phases, stopping at the first failed one.
+
+        With `collect` flag, all phases are executed and the single
+        ValidationError reports every XSD, codelist and schematron error.
+
+        With `stream` flag, XSD and codelists are checked by `iterparse` one
+        top-level section at a time and validated sections are dropped. It
+        reduces memory, but it still grows with the document and the whole
+        section is kept until it's validated. Schematron rules
+        are applied to the whole tree, so combine it with `schematron=False`
+        to avoid building it.
+
+        Outcome is stored in the result cache, so repeated validation of the
+        same document returns immediately.
+        """
+        key = self.result_key(codelists, schematron, collect)
+        if result_cache_size():
+            errors = results.get(key)
+            if errors is not None:
+                self.cached = True
+                if errors:
+                    raise tk.ValidationError(errors)
+                return
+
+        try:
+            self._validate(codelists, schematron, collect, stream)
+        except tk.ValidationError as e:
+            if result_cache_size():
+                results.set(key, e.error_dict)
+            raise
+
+        if result_cache_size():
+            results.set(key, {})
+
+    def result_key(self, codelists: bool, schematron: bool, collect: bool) -> str:
+        """Key of the validation outcome inside the result cache."""
+        digest = hashlib.sha256(self.digest.encode())
+        options = [self.name, codelists, schematron, collect and _max_errors()]
+        digest.update(repr(options).encode())
+        return f"{validation_stamp(self.name)}-{digest.hexdigest()}"
+
+    def _validate(self, codelists: bool, schematron: bool, collect: bool, stream: bool):
+        if not collect:
+            self.validate_schema(codelists, stream=stream)
+            if schematron:
+                self.validate_schematron()
+            return
+
+        if not stream:
+            # malformed document cannot be checked by any phase
+            self.tree
+        errors: dict[str, list[str]] = {}
+        phases = [
+            functools.partial(
+                self.validate_schema, codelists, collect=True, stream=stream
+            )
+        ]
+        if schematron:
+            phases.append(self.validate_schematron)
+
+        for phase in phases:
+            try:
+                phase()
+            except tk.ValidationError as e:
+                errors.update(e.error_dict)
+                if "content" in errors:
+                    break
+
+        if errors:
+            raise tk.ValidationError(errors)
+
+    def validate_schema(
+        self,
+        validate_codelists: bool = False,
+        collect: bool = False,
+        stream: bool = False,
+    ):
+        if collect:
+            limit = _max_errors()
+            failures = self.check_schema(validate_codelists, limit + 1, stream)
+            if failures:
+                errors = [f.message for f in failures[:limit]]
+                if len(failures) > limit:
+                    errors.append(f"Too many errors. Only first {limit} are reported")
+                raise tk.ValidationError({"schema": errors})
+            return
+
+        schema = get_schema(self.name)
+        try:
+            with self._source(stream) as source, self._schema_timer():
+                schema.validate(
+                    source, extra_validator=self._extra_validator(validate_codelists)
+                )
+        except xmlschema.XMLSchemaValidationError as e:
+            raise tk.ValidationError({"schema": [SchemaFailure.from_error(e).message]})
+
+    def check_schema(
+        self,
+        validate_codelists: bool = False,
+        limit: Optional[int] = None,
+        stream: bool = False,
+    ) -> list[SchemaFailure]:
+        """Collect XSD and codelist errors in document order.
+
+        Validation stops after `limit` errors.
+        """
+        schema = get_schema(self.name)
+        with self._source(stream) as source, self._schema_timer():
+            errors = schema.iter_errors(
+                source, extra_validator=self._extra_validator(validate_codelists)
+            )
+            return [
+                SchemaFailure.from_error(e) for e in itertools.islice(errors, limit)
+            ]
+
+    @contextlib.contextmanager
+    def _schema_timer(self) -> Iterator[None]:
+        """Time XSD validation, excluding codelist checks made during it."""
+        codelists = self.timings.get("codelists", 0)
+        with self._timer("schema"):
+            yield
+        self.timings["schema"] -= self.timings.get("codelists", 0) - codelists
+
+    def _extra_validator(self, codelists: bool) -> Callable[..., Any]:
+        validator = get_extra_validator(codelists)
+        if not codelists:
+            return validator
+
+        timings = self.timings
+        timings.setdefault("codelists", 0)
+
+        # called for every element, so avoid the overhead of _timer
+        def timed(el: xtree.Element, xsd: xmlschema.XMLSchemaBase):
+            start = time.perf_counter()
+            try:
+                validator(el, xsd)
+            finally:
+                timings["codelists"] += time.perf_counter() - start
+
+        return timed
+
+    @contextlib.contextmanager
+    def _source(self, stream: bool) -> Iterator[Any]:
+        """Source for XSD validation: parsed tree or lazy resource.
+
+        Lazy resource parses one child of the root at a time and clears it
+        once it's validated, keeping only an empty element that is required
+        for validation of the root. Deeper lazy levels are not used: they are
+        several times slower while memory still grows with the document, and
+        the deepest ones cannot resolve local elements, reporting false
+        errors.
+        """
+        if not stream:
+            yield self.tree.getroot()
+            return
+
+        source = self.content
+        if isinstance(source, bytes):
+            source = BytesIO(source)
+        source.seek(0)
+        try:
+            yield xmlschema.XMLResource(source, lazy=True)
+        except (xtree.ParseError, ltree.XMLSyntaxError) as e:
+            raise tk.ValidationError({"content": [str(e)]})
+
+    @functools.cached_property
+    def census(self) -> frozenset[str]:
+        """Qualified names of all elements inside the document."""
+        return frozenset(el.tag for el in self.tree.iter() if isinstance(el.tag, str))
+
+    def validate_schematron(
+        self, schemas: Iterable[str] = frozenset(), force_all: Optional[bool] = None
+    ):
+        failures = self.check_schematron(schemas, force_all)
+        if failures:
+            # drop duplicates, keeping the first occurrence
+            errors = dict.fromkeys(f.message for f in failures)
+            raise tk.ValidationError({"schematron": list(errors)})
+
+    def check_schematron(
+        self, schemas: Iterable[str] = frozenset(), force_all: Optional[bool] = None
+    ) -> list[SchematronFailure]:
+        """Collect failed schematron assertions.
+
+        Failures are ordered by rule set (in the order of
+        `schematron_mapping`) and then by assertion.
+
+        Rule sets that have no rules applicable to elements of the document
+        are skipped, unless `force_all` flag(or corresponding config option)
+        is enabled.
+        """
+        names = list(schematron_mapping)
+        if schemas:
+            unknown = set(schemas).difference(names)
+            if unknown:
+                raise KeyError(f"Unknown schematron rules: {sorted(unknown)}")
+            names = [name for name in names if name in schemas]
+
+        if force_all is None:
+            force_all = tk.asbool(tk.config.get(CONFIG_SCHEMATRON_FORCE_ALL))
+        if not force_all:
+            names = [name for name in names if self._applicable(name)]
+        if not names:
+            return []
+
+        # only the fixed groups are compiled, so that subsets chosen by the
+        # content of documents do not produce new validators. Groups with any
+        # of the selected rule sets are run and failures of the rest of the
+        # group are dropped
+        selected = set(names)
+        workers = configured_schematron_workers()
+        groups = [
+            group for group in schematron_groups(workers) if selected & set(group)
+        ]
+
+        # document is parsed before it's shared between threads. Results are
+        # collected in the order of groups, not in the order of completion, so
+        # the list of errors is stable
+        tree = self.tree
+
+        def run(group: tuple[str, ...]) -> tuple[list[SchematronFailure], float]:
+            start = time.perf_counter()
+            failures = run_schematron(tree, group)
+            return failures, time.perf_counter() - start
+
+        with self._timer("schematron"):
+            if len(groups) > 1:
+                reports = list(get_schematron_executor(workers).map(run, groups))
+            else:
+                reports = [run(group) for group in groups]
+
+        for group, (_failures, duration) in zip(groups, reports):
+            self.timings[f"schematron:{'+'.join(group)}"] = duration
+
+        return [
+            failure
+            for report, _duration in reports
+            for failure in report
+            if failure.rules in selected
+        ]
+
+    def _applicable(self, name: str) -> bool:
+        triggers = schematron_triggers(name)
+        return triggers is None or not triggers.isdisjoint(self.census)
+
+
+class SchemaFailure(NamedTuple):
+    path: str
+    reason: str
+    message: str
+
+    @classmethod
+    def from_error(cls, error: xmlschema.XMLSchemaValidationError) -> SchemaFailure:
+        """Describe error by path and reason.
+
+        String form of the error includes serialized instance with every
+        namespace declaration in scope, which is unreadable in reports.
+        """
+        path = error.path or ""
+        reason = error.reason or ""
+        return cls(path, reason, f"{path}: {reason}")
+
+
+def validate_schema(
+    content: bytes, name: str = DEFAULT_XSD, validate_codelists: bool = False
+):
+    ValidationPipeline(content, name).validate_schema(validate_codelists)
+
+
+def validate_schematron(content: bytes, schemas: Iterable[str] = frozenset()):
+    ValidationPipeline(content).validate_schematron(schemas)
+
+
+def _max_errors() -> int:
+    return tk.asint(tk.config.get(CONFIG_MAX_ERRORS, DEFAULT_MAX_ERRORS))
+
+
+def collect_files(sources: Iterable[str], pattern: str = "*.xml") -> Iterator[Path]:
+    """Expand directories and glob patterns into paths of files.
+
+    Directories are searched recursively for files matching the `pattern`.
+    """
+    for source in sources:
+        path = Path(source)
+        if path.is_dir():
+            yield from sorted(p for p in path.rglob(pattern) if p.is_file())
+        elif glob.has_magic(source):
+            yield from (Path(p) for p in sorted(glob.glob(source, recursive=True)))
+        else:
+            yield path
+
+
+def validate_files(
+    paths: Iterable[Path],
+    workers: int = 0,
+    codelists: bool = True,
+    schematron: bool = True,
+    collect: bool = False,
+    stream: bool = False,
+) -> Iterator[dict[str, Any]]:
+    """Validate files across the pool of processes.
+
+    Workers of `validation_pool` start with the warm state. Reports are
+    produced in the order of paths. On platforms without `fork`, files are
+    validated sequentially by the current process.
+    """
+    check = functools.partial(
+        _validate_path,
+        codelists=codelists,
+        schematron=schematron,
+        collect=collect,
+        stream=stream,
+    )
+    pool = validation_pool(workers)
+    if pool is None:
+        yield from map(check, paths)
+        return
+
+    with pool:
+        yield from pool.map(check, paths, chunksize=8)
+
+
+def validation_pool(workers: int = 0) -> Optional[ProcessPoolExecutor]:
+    """Pool of processes that start with warm validation state.
+
+    Schemas, codelists and schematron validators are loaded before the pool
+    is created and inherited by forked workers. Workers check schematron in a
+    single thread, so validators are compiled for the groups used by a single
+    thread. None is returned when documents must be validated by the current
+    process, i.e. single worker is requested or platform does not support
+    `fork`.
+    """
+    if "fork" not in multiprocessing.get_all_start_methods() or workers == 1:
+        warm_cache()
+        return None
+
+    warm_cache(schematron_workers=_VALIDATION_WORKER_THREADS)
+    return ProcessPoolExecutor(
+        workers or None,
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=_init_validation_worker,
+    )
+
+
+def shared_validation_pool(workers: int) -> Optional[ProcessPoolExecutor]:
+    """Long-lived `validation_pool` of the current process.
+
+    Pool is created by the first call and reused by the following ones, so
+    web workers fork validation processes once instead of on every request.
+    Callers must not shut the pool down, but report it via
+    `discard_shared_validation_pool` when it's broken, e.g. a worker was
+    killed. Pool that belongs to the parent of a forked process is replaced
+    as well. Workers are stopped when the process exits.
+    """
+    global _shared_pool
+
+    with _shared_pool_lock:
+        if _shared_pool:
+            pid, pool = _shared_pool
+            # there is no public way to check if the pool is broken
+            if pid == os.getpid() and not getattr(pool, "_broken", False):
+                return pool
+
+        pool = validation_pool(workers)
+        _shared_pool = (os.getpid(), pool) if pool else None
+        return pool
+
+
+def discard_shared_validation_pool(pool: ProcessPoolExecutor):
+    """Shut down the broken pool, so that the next call of
+    `shared_validation_pool` creates a new one."""
+    global _shared_pool
+
+    with _shared_pool_lock:
+        if _shared_pool and _shared_pool[1] is pool:
+            _shared_pool = None
+    pool.shutdown(wait=False)
+
+
+def _init_validation_worker():
+    tk.config[CONFIG_SCHEMATRON_WORKERS] = _VALIDATION_WORKER_THREADS
+
+
+def check_document(source: Union[bytes, IO[bytes]], **options: Any) -> dict[str, Any]:
+    """Validate the document and report its errors instead of raising them.
+
+    Report contains `ok` flag, `errors` and the profile of the pipeline with
+    the `total` duration of validation added to its timings.
+    """
+    start = time.perf_counter()
+    report: dict[str, Any] = {"ok": True, "errors": {}}
+    pipeline = ValidationPipeline(source)
+    try:
+        pipeline.validate(**options)
+    except tk.ValidationError as e:
+        report.update(ok=False, errors=e.error_dict)
+    finally:
+        report.update(pipeline.profile())
+
+    report["timings"]["total"] = time.perf_counter() - start
+    return report
+
+
+def _validate_path(path: Path, **options: Any) -> dict[str, Any]:
+    start = time.perf_counter()
+    report: dict[str, Any] = {"file": str(path)}
+    try:
+        with path.open("rb") as source:
+            report.update(check_document(source, **options))
+    except OSError as e:
+        report.update(
+            ok=False,
+            errors={"file": [str(e)]},
+            timings={"total": time.perf_counter() - start},
+        )
+
+    return report
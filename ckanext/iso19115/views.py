@@ -1,44 +1,153 @@
 from __future__ import annotations
 
+from io import BytesIO
+from typing import Any
+
 import ckan.plugins.toolkit as tk
 from flask import Blueprint
 from flask.views import MethodView
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.wsgi import LimitedStream
 
-from ckanext.iso19115 import utils
+from ckanext.iso19115.config import (
+    CONFIG_ASYNC_VALIDATION,
+    CONFIG_MAX_UPLOAD_SIZE,
+    DEFAULT_MAX_UPLOAD_SIZE,
+)
 
 iso19115 = Blueprint("iso19115", __name__)
 
+_VALIDATE_PATH = "/-iso19115/validate"
+
 
 def get_blueprints():
     return [iso19115]
 
 
+def _upload_limit() -> int:
+    size = tk.asint(tk.config.get(CONFIG_MAX_UPLOAD_SIZE, DEFAULT_MAX_UPLOAD_SIZE))
+    return size * 1024 * 1024
+
+
+def limit_upload_size(wsgi_app: Any) -> Any:
+    """Middleware that limits the body of the validation form.
+
+    Werkzeug raises RequestEntityTooLarge as soon as the limit is exceeded,
+    while the body is parsed, even if the request has no Content-Length.
+    Request that declares bigger size is rejected before the body is read.
+    MAX_CONTENT_LENGTH is not used, because it applies to every request of
+    the application, and the view cannot check the size itself, because CSRF
+    protection parses the form before the view is called.
+    """
+
+    def middleware(environ: dict[str, Any], start_response: Any):
+        # the path is not stripped of the language or root path prefix yet
+        path: str = environ.get("PATH_INFO", "")
+        if environ.get("REQUEST_METHOD") == "POST" and path.endswith(_VALIDATE_PATH):
+            limit = _upload_limit()
+            declared = int(environ.get("CONTENT_LENGTH") or 0)
+            environ["wsgi.input"] = LimitedStream(
+                environ["wsgi.input"], 0 if declared > limit else limit, is_max=True
+            )
+        return wsgi_app(environ, start_response)
+
+    return middleware
+
+
+def _render(data=None, errors=None, **extra_vars):
+    extra_vars.update({"data": data, "errors": errors})
+
+    return tk.render("iso19115/validate.html", extra_vars)
+
+
 class ValidateView(MethodView):
     def post(
         self,
     ):
+        from ckanext.iso19115 import validation
+
         value = tk.request.form.get("content", "")
-        content = bytes(value, "utf8")
+        all_errors = tk.asbool(tk.request.form.get("all_errors"))
+        upload = tk.request.files.get("upload")
         errors = {}
 
+        if upload and upload.filename:
+            # document is not copied into the form. It's already spooled by
+            # werkzeug, so the seekable stream is validated as is
+            value = ""
+            content = upload.stream
+        else:
+            content = BytesIO(bytes(value, "utf8"))
+
+        if tk.asbool(tk.config.get(CONFIG_ASYNC_VALIDATION)):
+            from ckanext.iso19115 import jobs
+
+            job_id = jobs.get_queue().submit(content, all_errors)
+            return tk.redirect_to("iso19115.validation_job", job_id=job_id)
+
         try:
-            utils.validate_schema(content, validate_codelists=True)
-            utils.validate_schematron(content)
+            validation.ValidationPipeline(content).validate(collect=all_errors)
         except tk.ValidationError as e:
-            errors = e.error_summary
+            if all_errors:
+                errors = {f: "\n".join(errs) for f, errs in e.error_dict.items()}
+            else:
+                errors = e.error_summary
             tk.h.flash_error("Document is not valid")
         else:
             tk.h.flash_success("Document is valid")
 
-        return self._render({"content": value}, errors)
+        return _render({"content": value, "all_errors": all_errors}, errors)
 
     def get(self):
-        return self._render()
+        return _render()
+
+
+def _too_big(error: RequestEntityTooLarge):
+    tk.h.flash_error("Document is not valid")
+    errors = {"upload": f"Document is bigger than {_upload_limit() // 1024 // 1024}MB"}
+    return _render({}, errors), 413
+
+
+def validation_job(job_id: str):
+    """Show the result of the validation job or wait until it's ready."""
+    from ckanext.iso19115 import jobs
+
+    report = jobs.get_queue().status(job_id)
+    if report is None:
+        return tk.abort(404, tk._("Validation job not found"))
+
+    # submitted document is not echoed back, it may be arbitrarily large
+    data = {"content": ""}
+    if report["status"] not in (jobs.FINISHED, jobs.FAILED):
+        return _render(data, job=report)
+
+    errors = {f: "\n".join(errs) for f, errs in report["errors"].items()}
+    if report["valid"]:
+        tk.h.flash_success("Document is valid")
+    else:
+        tk.h.flash_error("Document is not valid")
+
+    return _render(data, errors)
+
+
+def validation_job_status(job_id: str):
+    """Status of the validation job, for polling by scripts."""
+    from ckanext.iso19115 import jobs
 
-    def _render(self, data=None, errors=None):
-        extra_vars = {"data": data, "errors": errors}
+    report = jobs.get_queue().status(job_id)
+    if report is None:
+        return tk.abort(404, tk._("Validation job not found"))
 
-        return tk.render("iso19115/validate.html", extra_vars)
+    return report
 
 
-iso19115.add_url_rule("/-iso19115/validate", view_func=ValidateView.as_view("validate"))
+iso19115.add_url_rule(_VALIDATE_PATH, view_func=ValidateView.as_view("validate"))
+iso19115.add_url_rule(
+    "/-iso19115/validate/<job_id>", view_func=validation_job, endpoint="validation_job"
+)
+iso19115.add_url_rule(
+    "/-iso19115/validate/<job_id>/status",
+    view_func=validation_job_status,
+    endpoint="validation_job_status",
+)
+iso19115.register_error_handler(RequestEntityTooLarge, _too_big)